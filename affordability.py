@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+from loan import max_loan
+from price_cube import QUANTILES
+
+# HDB concessionary loan rate assumed by the calculator
+INTEREST_RATE = 0.026
+
+# Price distribution points per town and flat type, lowest to highest. Each
+# neighbouring pair brackets a quarter of the transactions.
+DISTRIBUTION = ['min', *QUANTILES, 'max']
+
+# Columns expected in a table of household profiles
+PROFILE_COLUMNS = ['income', 'savings', 'debts', 'loan_tenure']
+
+
+def flat_budget(income, savings, debts, loan_tenure, interest_rate=INTEREST_RATE):
+    """Budget for a flat, for scalars or arrays of household finances.
+
+    The largest amortizing loan allowed by the MSR and TDSR limits plus
+    savings; see loan.max_loan.
+    """
+    return max_loan(income, debts, interest_rate, loan_tenure) + np.asarray(savings, dtype=float)
+
+
+def price_table(cells):
+    """Combines price cube cells into one row per town and flat type.
+
+    Returns count, mean, min, max and the blended quartiles, the same
+    statistics price_cube.summarize gives for a single selection.
+    """
+    weighted = cells[['town', 'flat_type', 'count']].copy()
+    for name in QUANTILES:
+        weighted[name] = cells[name] * cells['count']
+    weighted['sum'] = cells['sum']
+    weighted['min'] = cells['min']
+    weighted['max'] = cells['max']
+
+    grouped = weighted.groupby(['town', 'flat_type'], observed=True)
+    table = grouped[['sum', 'count', *QUANTILES]].sum()
+    table['min'] = grouped['min'].min()
+    table['max'] = grouped['max'].max()
+    table['mean'] = table['sum'] / table['count']
+    for name in QUANTILES:
+        table[name] = table[name] / table['count']
+    return table[['count', 'mean', *DISTRIBUTION]]
+
+
+def share_affordable(budgets, knots):
+    """Approximate share of transactions priced at or below each budget.
+
+    budgets has shape (n,) and knots (m, 5) holding min, p25, p50, p75 and
+    max per row; the result has shape (n, m). Prices are assumed to be spread
+    evenly between neighbouring knots.
+    """
+    budgets = np.asarray(budgets, dtype=float)[:, None, None]
+    low = knots[None, :, :-1]
+    width = knots[None, :, 1:] - low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        filled = np.where(width > 0, (budgets - low) / width, (budgets >= low).astype(float))
+    return np.clip(filled, 0, 1).sum(axis=2) / (knots.shape[1] - 1)
+
+
+def affordability_matrix(prices, budget):
+    """Scores one budget against every town and flat type.
+
+    prices is a price_table. Returns a frame with the budget headroom over the
+    average price, whether the average is affordable and the share of
+    transactions within budget, indexed like prices.
+    """
+    result = prices[['count', 'mean']].copy()
+    result['headroom'] = budget - prices['mean'].to_numpy()
+    result['affordable'] = result['headroom'] >= 0
+    result['share_affordable'] = share_affordable([budget], prices[DISTRIBUTION].to_numpy())[0]
+    return result
+
+
+def score_households(profiles, prices):
+    """Scores a table of household profiles against every town and flat type.
+
+    profiles needs the PROFILE_COLUMNS; optional town and flat_type columns
+    name each household's target. Adds the budget, how many town and flat
+    type combinations are affordable on average price, the cheapest of them
+    and, where a target is given, its average price and whether it is
+    affordable. Every household is scored in one broadcast over the prices.
+    """
+    missing = [column for column in PROFILE_COLUMNS if column not in profiles.columns]
+    if missing:
+        raise ValueError(f"Missing household columns: {', '.join(missing)}")
+
+    scored = profiles.copy()
+    budgets = flat_budget(*(profiles[column].to_numpy() for column in PROFILE_COLUMNS))
+    scored['budget'] = budgets
+
+    means = prices['mean'].to_numpy()
+    affordable = budgets[:, None] >= means[None, :]
+    scored['options_affordable'] = affordable.sum(axis=1)
+
+    # Cheapest combination each household can afford, if any
+    scored['cheapest_option'] = None
+    if len(means):
+        labels = np.array([f"{flat_type} in {town}" for town, flat_type in prices.index], dtype=object)
+        cheapest = np.where(affordable, means[None, :], np.inf).argmin(axis=1)
+        scored['cheapest_option'] = np.where(affordable.any(axis=1), labels[cheapest], None)
+
+    if {'town', 'flat_type'} <= set(profiles.columns):
+        targets = pd.MultiIndex.from_arrays([
+            profiles['town'].astype(str).str.lower(),
+            profiles['flat_type'].astype(str).str.lower(),
+        ])
+        target_means = prices['mean'].reindex(targets).to_numpy()
+        scored['target_price'] = target_means
+        scored['target_affordable'] = budgets >= target_means
+    return scored
@@ -1,28 +1,25 @@
 import streamlit as st
 import pandas as pd
-import openai
-import glob  # Import glob to locate CSV files
-import os
+from affordability import INTEREST_RATE, affordability_matrix, flat_budget, price_table, score_households
+from data_store import load_data
+from instrumentation import span, timed_iter
+from llm_cache import cached_stream_chat_completion
+from llm_gateway import LLMUnavailable
+from loan import MSR, TDSR, sensitivity_grid
+from price_cube import mean_price, price_cube, select_cells
 
-def load_and_preprocess_data():
-    # Load all CSV files in the data folder (same as in general_query)
-    all_files = glob.glob(os.path.join("data", "*.csv"))
-    df_list = [pd.read_csv(file) for file in all_files]
-    df = pd.concat(df_list, ignore_index=True)
-    
-    # Data cleaning and transformation
-    df['month'] = pd.to_datetime(df['month'], format='%Y-%m')
-    df['resale_price'] = pd.to_numeric(df['resale_price'], errors='coerce')
-    
-    # Filter data for 2023 and 2024
-    df = df[df['month'].dt.year.isin([2023, 2024])]
-    return df
+# Years of recent transactions the calculator compares against
+RECENT_YEARS = [2023, 2024]
 
 def affordability_calculator():
     st.title("HDB Resale Housing Affordability Calculator")
     st.image("image/hdb_afford.jpg", width=200, caption="Housing Calculator")
     st.write("This feature will consider recent flats (in 2023-2024) of your selected type in the selected town.")
-    df = load_and_preprocess_data()
+    # Prices come from the pre-aggregated cube of the shared frame
+    with span('load'):
+        cube = price_cube(load_data())
+    with span('filter', source='price_cube'):
+        recent = select_cells(cube, year=RECENT_YEARS)
     
     # Collect user inputs
     st.write("Provide information about your finances:")
@@ -32,17 +29,59 @@ def affordability_calculator():
     loan_tenure = st.number_input("Enter the loan tenure you expect to take (in years)", min_value=1, max_value=30)
 
     st.write("Choose your desired home:")
-    target_town = st.selectbox("Select your desired Town", df['town'].unique())
-    flat_type = st.selectbox("Select your targeted flat type", df['flat_type'].unique())
+    target_town = st.selectbox("Select your desired Town", recent['town'].unique())
+    flat_type = st.selectbox("Select your targeted flat type", recent['flat_type'].unique())
     
     # Loan and affordability calculations using HDB loan
-    interest_rate = 0.026
-    max_loan = (income - debts) * 12 * loan_tenure * (1 - interest_rate)
-    affordable_price = max_loan + savings
+    with span('compute', what='budget'):
+        affordable_price = float(flat_budget(income, savings, debts, loan_tenure, INTEREST_RATE))
+
+    # Average price for target flat type and town
+    avg_resale_price = float('nan')
+    if target_town and flat_type:
+        with span('filter', source='price_cube'):
+            avg_resale_price = mean_price(recent, town=target_town, flat_type=flat_type, exact=True)
+
+    # Budget for a range of rates and tenures, computed as one array operation
+    with st.expander("How does my budget change with interest rate and loan tenure?"):
+        st.write(f"Loans are sized so repayments stay within {MSR:.0%} of income (MSR) "
+                 f"and all debt repayments within {TDSR:.0%} of income (TDSR).")
+        rates = [0.015, 0.02, INTEREST_RATE, 0.03, 0.035, 0.04, 0.045]
+        tenures = list(range(5, 31, 5))
+        with span('compute', what='sensitivity'):
+            grid = sensitivity_grid(income, debts, savings, rates, tenures)
+            grid.index = [f"{rate:.1%}" for rate in grid.index]
+        with span('render', rows=len(grid)):
+            st.line_chart(grid.T, x_label="Loan tenure (years)", y_label="Affordable price (SGD)")
+            st.dataframe(grid.round(0))
 
-    # Filtered data for target flat type and town
-    target_df = df[(df['town'] == target_town) & (df['flat_type'] == flat_type)]
-    avg_resale_price = target_df['resale_price'].mean()
+    # Every town and flat type at once, scored against the same price aggregates
+    with span('compute', what='price_table'):
+        prices = price_table(recent)
+    with st.expander("What can I afford everywhere?"):
+        if prices.empty:
+            st.write("No recent price data available.")
+        else:
+            with span('compute', what='matrix'):
+                matrix = affordability_matrix(prices, affordable_price)
+            with span('render', rows=len(matrix)):
+                st.write("Share of recent transactions (%) within your budget, by town and flat type:")
+                st.dataframe((matrix['share_affordable'].unstack('flat_type') * 100).round(0))
+
+    with st.expander("Score a table of applicants"):
+        st.write("Upload a CSV with income, savings, debts and loan_tenure columns, "
+                 "and optionally each applicant's target town and flat_type.")
+        uploaded = st.file_uploader("Applicants CSV", type="csv")
+        if uploaded is not None:
+            try:
+                with span('compute', what='score_households'):
+                    scored = score_households(pd.read_csv(uploaded), prices)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.dataframe(scored)
+                st.download_button("Download scores", scored.to_csv(index=False),
+                                   file_name="affordability_scores.csv", mime="text/csv")
 
     if st.button("Calculate Affordability"):
         if pd.isna(avg_resale_price):
@@ -53,17 +92,21 @@ def affordability_calculator():
 
             # Determine affordability and display result
             if affordable_price >= avg_resale_price:
-                st.success("Congratulations! You can afford this flat based on your inputs, assuming an HDB loan of 2.6%. Please wait (~30s) while we give you more personalized advice...")
+                st.success("Congratulations! You can afford this flat based on your inputs, assuming an HDB loan of 2.6%. Personalized advice will appear below as it is generated...")
             else:
-                st.warning("The target flat may not be affordable based on your inputs, assuming an HDB loan of 2.6%. Please wait (~30s) while we give you more personalized advice...")
+                st.warning("The target flat may not be affordable based on your inputs, assuming an HDB loan of 2.6%. Personalized advice will appear below as it is generated...")
 
-            # Generate personalized advice using LLM
+            # Generate personalized advice using LLM. Figures are rounded to bands so
+            # households in similar situations share a cached response.
             user_query = (
-                f"My monthly income is ${income}, with total savings of ${savings}, and monthly debts of ${debts}. "
-                f"I want to buy a {flat_type} in {target_town}. The average price is around ${avg_resale_price:.2f}. "
-                f"I can afford up to ${affordable_price:.2f}. Can you give me advice on how I could afford this flat?"
+                f"My monthly income is about ${round(income, -2):,.0f}, with total savings of about "
+                f"${round(savings, -4):,.0f}, and monthly debts of about ${round(debts, -2):,.0f}. "
+                f"I want to buy a {flat_type} in {target_town} with a {loan_tenure}-year loan. "
+                f"The average price is around ${round(avg_resale_price, -3):,.0f}. "
+                f"I can afford up to about ${round(affordable_price, -4):,.0f}. "
+                f"Can you give me advice on how I could afford this flat?"
             )
-            response = openai.ChatCompletion.create(
+            advice = timed_iter('openai', cached_stream_chat_completion(
                 model="gpt-4",
                 messages=[
                     {
@@ -78,5 +121,8 @@ def affordability_calculator():
                     },
                     {"role": "user", "content": user_query}
                 ]
-            )
-            st.write(response['choices'][0]['message']['content'])
+            ), model="gpt-4")
+            try:
+                st.write_stream(advice)
+            except LLMUnavailable as e:
+                st.warning(f"Personalized advice is not available: {e}")
@@ -1,10 +1,22 @@
+import importlib
 import streamlit as st
-from affordability_calculator import affordability_calculator
-from about_us import about_us
-from general_query import general_query
-from methodology import methodology
+from instrumentation import span, timing_panel
 from utils import password_protect
 
+# Page name -> (module, function). Page modules pull in pandas, openai and the
+# data store, so each is imported only when its page is first shown; the login
+# and Main pages load none of them.
+PAGES = {
+    "Main": None,
+    "General Query on HDB": ("general_query", "general_query"),
+    "Affordability Calculator": ("affordability_calculator", "affordability_calculator"),
+    "About Us": ("about_us", "about_us"),
+    "Methodology": ("methodology", "methodology"),
+}
+
+def load_page(name):
+    module, function = PAGES[name]
+    return getattr(importlib.import_module(module), function)
 
 # Password protect the app
 if not password_protect():
@@ -14,7 +26,7 @@ if not password_protect():
 st.sidebar.title("Navigation")
 option = st.sidebar.radio(
     "Choose a page", 
-    ["Main", "General Query on HDB", "Affordability Calculator", "About Us", "Methodology"]
+    list(PAGES)
 )
 
 #Main program based on navigation
@@ -31,25 +43,18 @@ def main():
         Always consult with qualified professionals for accurate and personalized advice.
         """)
 
-    # Main Page Content
-    if option == "Main":
-        st.title("HDB Resale Information Platform")
-        
-    # Housing Affordability Calculator Page
-    elif option == "Affordability Calculator":
-        affordability_calculator()
-
-    # General Query Page
-    elif option == "General Query on HDB":
-        general_query()
-
-    # About Us Page
-    elif option == "About Us":
-        about_us()
-
-    # Methodology Page
-    elif option == "Methodology":
-        methodology()
+    # Each page run is timed as a whole; the pages time their own stages
+    with span('page', page=option):
+        # Main Page Content
+        if option == "Main":
+            st.title("HDB Resale Information Platform")
+
+        # Housing Affordability Calculator, General Query, About Us and Methodology pages
+        else:
+            load_page(option)()
+
+    # Stage latencies, shown to admins only
+    timing_panel()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,306 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import affordability_calculator
+import data_store
+import general_query
+import numpy as np
+import pandas as pd
+import trend_charts
+from affordability import affordability_matrix, flat_budget, price_table, score_households
+from data_store import DATA_DIR, SNAPSHOT_NAME, legacy_frame, load_data, read_data, source_signature
+from intent_parser import answer_query, parse_query, query_vocabulary
+from price_cube import build_price_cube, price_cube, select_cells
+from query_cache import result_cache
+from query_engine import QueryEngine
+from query_executor import QueryExecutor
+from trend_charts import _render_svg, trend_series
+
+RESULTS_PATH = "benchmark_results.json"
+THRESHOLDS_PATH = "benchmark_thresholds.json"
+
+# Row multipliers of the datasets: 1 is the real CSVs in data/, the others
+# are synthetic copies of them with jittered prices
+SCALES = [1, 10, 100]
+REPEAT = 5
+# The legacy loader holds every string as a Python object; beyond this scale
+# it no longer fits in memory next to everything else
+LEGACY_MAX_SCALE = 10
+# Relative slowdown against a baseline run that counts as a regression
+TOLERANCE = 0.25
+
+# Canned LLM answer for the [QUERY] benchmarks: two precomputed aggregates,
+# one year filter answered from the indexes and one query for the executor
+STUB_LLM_RESPONSE = (
+    "Most resales were in [QUERY]df['town'].value_counts()[/QUERY], at an average of "
+    "[QUERY]df.groupby('flat_type')['resale_price'].mean()[/QUERY]. In 2015 there were "
+    "[QUERY]df[df['month'].dt.year == 2015][/QUERY] and the priciest 4 room flat sold for "
+    "[QUERY]df[df['flat_type'] == '4 room']['resale_price'].max()[/QUERY]."
+)
+STUB_CHUNK_SIZE = 16
+HOUSEHOLDS = 10_000
+
+
+def scaled_dataset(scale, workdir, data_dir=DATA_DIR, seed=0):
+    """Returns a data directory holding scale times the rows of data_dir.
+
+    Scale 1 is a copy of the real CSVs. Larger scales repeat every row with
+    resale prices jittered by up to 5%, written as one CSV per year so the
+    copies do not overlap as releases and survive deduplication.
+    """
+    target = os.path.join(workdir, f"x{scale}", DATA_DIR)
+    if os.path.isdir(target):
+        return target
+    os.makedirs(target)
+    files = sorted(glob.glob(os.path.join(data_dir, "*.csv")))
+    if scale == 1:
+        for file in files:
+            shutil.copy2(file, target)
+        return target
+
+    rng = np.random.default_rng(seed)
+    for file in files:
+        raw = pd.read_csv(file)
+        stem = os.path.splitext(os.path.basename(file))[0]
+        for year, rows in raw.groupby(raw['month'].str[:4]):
+            copies = pd.concat([rows] * scale, ignore_index=True)
+            jitter = rng.uniform(0.95, 1.05, len(copies))
+            copies['resale_price'] = (copies['resale_price'] * jitter).round(-3)
+            copies.to_csv(os.path.join(target, f"{stem} x{scale} {year}.csv"), index=False)
+    return target
+
+
+def measure(fn, repeat=REPEAT, setup=None, warmup=1):
+    """Runs fn repeat times and returns its timings in milliseconds.
+
+    The first warmup runs are not timed, so lazy imports, first-call
+    allocations and the like are not counted. setup runs before every run.
+    """
+    timings = []
+    for run in range(warmup + repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        if run >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'runs': repeat,
+    }
+
+
+def _remove_snapshot(data_dir):
+    path = os.path.join(data_dir, SNAPSHOT_NAME)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _clear_charts():
+    trend_charts._cached_series.clear()
+    trend_charts._cached_chart.clear()
+
+
+def _stub_chunks(text, size=STUB_CHUNK_SIZE):
+    # The stubbed LLM stream: the canned answer cut into small deltas
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+def run_benchmarks(scale, data_dir, repeat=REPEAT):
+    """Times the load, filter, aggregation and query paths on one dataset.
+
+    data_dir must be DATA_DIR relative to the working directory, since the
+    pages load their data from there. Returns {benchmark name: timings}.
+    """
+    results = {}
+    signature = source_signature(data_dir)
+    # Cold ingestion parses every CSV, so it runs fewer times on large data
+    cold_repeat = 1 if scale >= 100 else min(repeat, 3)
+
+    results['load.ingest_csv'] = measure(lambda: read_data(signature, data_dir), cold_repeat,
+                                         setup=lambda: _remove_snapshot(data_dir))
+    results['load.read_snapshot'] = measure(lambda: read_data(signature, data_dir), repeat)
+    if scale <= LEGACY_MAX_SCALE:
+        results['load.legacy_csv'] = measure(lambda: legacy_frame(signature), cold_repeat)
+
+    # The pages' loaders with the frame cache cleared (a new process or new
+    # data), then as a cache hit (every later script run)
+    results['load.general_query'] = measure(general_query.load_and_preprocess_data, repeat,
+                                            setup=data_store._load_cached.clear)
+    results['load.general_query.cached'] = measure(general_query.load_and_preprocess_data, repeat)
+    # The calculator page's load: the recent cells of the shared frame's price
+    # cube, which is rebuilt along with the frame when the cache is cleared
+    def load_recent_prices():
+        return select_cells(price_cube(load_data()), year=affordability_calculator.RECENT_YEARS)
+
+    results['load.affordability_calculator'] = measure(load_recent_prices, min(repeat, 3),
+                                                       setup=data_store._load_cached.clear)
+    results['load.affordability_calculator.cached'] = measure(load_recent_prices, repeat)
+
+    df = load_data()
+    results['index.price_cube_build'] = measure(lambda: build_price_cube(df), min(repeat, 3))
+    results['index.query_engine_build'] = measure(lambda: QueryEngine(df), min(repeat, 3))
+    cube = price_cube(df)
+
+    results['filter.average_resale_price'] = measure(
+        lambda: general_query.average_resale_price(df, '4 room', 2015, 'bedok'), repeat)
+    results['filter.average_resale_price.area_range'] = measure(
+        lambda: general_query.average_resale_price(df, '4 room', 2015, 'bedok', (90, 110)), repeat)
+    results['filter.intent_parser'] = measure(
+        lambda: answer_query(df, parse_query("median price of 5 room flats in tampines from 2013 to 2015",
+                                             query_vocabulary(df))), repeat)
+
+    results['chart.render'] = measure(
+        lambda: _render_svg(trend_series(df, flat_type='4 room', town=['bedok', 'tampines']), 6), min(repeat, 3))
+    results['chart.plot_resale_price_trend'] = measure(
+        lambda: general_query.plot_resale_price_trend(df, '4 room', None, 'bedok'), min(repeat, 3),
+        setup=_clear_charts)
+    results['chart.plot_resale_price_trend.cached'] = measure(
+        lambda: general_query.plot_resale_price_trend(df, '4 room', None, 'bedok'), repeat)
+
+    results['summary.extract_data_summary'] = measure(lambda: general_query.extract_data_summary(df), repeat)
+
+    # Starting the worker pool and mapping the frame, paid once per data version.
+    # A new executor every run: query_executor(df) would return the cached one
+    executors = []
+
+    def start_executor():
+        executors.append(QueryExecutor(df))
+        executors[-1].run("len(df)")
+
+    results['query.executor_startup'] = measure(start_executor, 1)
+    for executor in executors:
+        executor.close()
+    results['query.process_ai_response.uncached'] = measure(
+        lambda: general_query.process_ai_response_with_dataframe_queries(STUB_LLM_RESPONSE, df),
+        min(repeat, 3), setup=result_cache.clear)
+    results['query.process_ai_response.cached'] = measure(
+        lambda: general_query.process_ai_response_with_dataframe_queries(STUB_LLM_RESPONSE, df), repeat)
+    results['query.stream_ai_response.cached'] = measure(
+        lambda: ''.join(general_query.stream_ai_response_with_dataframe_queries(
+            _stub_chunks(STUB_LLM_RESPONSE), df)), repeat)
+
+    # The calculator page compares against the latest two years of the dataset
+    last_year = int(df['month'].max().year)
+    rng = np.random.default_rng(0)
+    households = pd.DataFrame({
+        'income': rng.integers(3000, 20000, HOUSEHOLDS),
+        'savings': rng.integers(0, 300000, HOUSEHOLDS),
+        'debts': rng.integers(0, 2000, HOUSEHOLDS),
+        'loan_tenure': rng.integers(5, 31, HOUSEHOLDS),
+    })
+
+    def affordability():
+        budget = float(flat_budget(8000, 100000, 500, 25))
+        prices = price_table(select_cells(cube, year=[last_year - 1, last_year]))
+        affordability_matrix(prices, budget)
+        return prices
+
+    results['affordability.page'] = measure(affordability, repeat)
+    prices = affordability()
+    results['affordability.score_households'] = measure(lambda: score_households(households, prices), repeat)
+    return results
+
+
+def check_thresholds(report, thresholds):
+    """Returns the benchmarks whose median exceeds its threshold (in ms)."""
+    failures = []
+    for scale, limits in thresholds.items():
+        for name, limit in limits.items():
+            result = report['results'].get(scale, {}).get(name)
+            if result is not None and result['median_ms'] > limit:
+                failures.append(f"{scale} {name}: {result['median_ms']:.1f} ms > {limit:.1f} ms threshold")
+    return failures
+
+
+def compare_baseline(report, baseline, tolerance=TOLERANCE):
+    """Returns the benchmarks more than tolerance slower than in a baseline report."""
+    failures = []
+    for scale, results in report['results'].items():
+        for name, result in results.items():
+            before = baseline['results'].get(scale, {}).get(name)
+            if before is not None and result['median_ms'] > before['median_ms'] * (1 + tolerance):
+                failures.append(f"{scale} {name}: {result['median_ms']:.1f} ms vs "
+                                f"{before['median_ms']:.1f} ms in the baseline")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times the data, query and affordability hot paths.")
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--thresholds', default=THRESHOLDS_PATH,
+                        help="JSON of {scale: {benchmark: max median ms}}; checked when the file exists")
+    parser.add_argument('--baseline', help="earlier results to compare against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--workdir', help="where the scaled datasets are kept (default: a temporary directory)")
+    args = parser.parse_args(argv)
+
+    source_dir = os.path.abspath(DATA_DIR)
+    output = os.path.abspath(args.output)
+    thresholds_path = os.path.abspath(args.thresholds)
+    baseline_path = args.baseline and os.path.abspath(args.baseline)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="hdb_benchmark_")
+    home = os.getcwd()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'rows': {},
+        },
+        'results': {},
+    }
+    try:
+        for scale in args.scales:
+            data_dir = scaled_dataset(scale, workdir, source_dir)
+            # The pages read DATA_DIR relative to the working directory
+            os.chdir(os.path.dirname(data_dir))
+            try:
+                print(f"x{scale}: benchmarking...", file=sys.stderr)
+                report['results'][f"x{scale}"] = run_benchmarks(scale, DATA_DIR, args.repeat)
+                report['meta']['rows'][f"x{scale}"] = len(load_data())
+            finally:
+                os.chdir(home)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for scale, results in report['results'].items():
+        print(f"\n{scale} ({report['meta']['rows'][scale]:,} rows)")
+        for name, result in results.items():
+            print(f"  {name:<45} {result['median_ms']:>12,.1f} ms")
+    print(f"\nResults written to {output}")
+
+    failures = []
+    if os.path.exists(thresholds_path):
+        with open(thresholds_path) as f:
+            failures += check_thresholds(report, json.load(f))
+    if baseline_path:
+        with open(baseline_path) as f:
+            failures += compare_baseline(report, json.load(f), args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
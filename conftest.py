@@ -0,0 +1 @@
+# Lets the tests import the app modules, which live at the top level of the repo
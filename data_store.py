@@ -0,0 +1,387 @@
+import streamlit as st
+import pandas as pd
+import pyarrow as pa
+import glob
+import json
+import os
+import re
+import resource
+import sys
+import threading
+import weakref
+
+DATA_DIR = "data"
+
+# Cleaned, typed copy of the CSVs kept next to them (Arrow IPC, uncompressed
+# so it can be memory-mapped)
+SNAPSHOT_NAME = ".resale_snapshot.arrow"
+
+# Bump whenever the cleaned schema changes so existing snapshots are rebuilt
+SNAPSHOT_VERSION = 3
+
+# Columns of the cleaned store, in order. Every release is reconciled to this
+# schema whatever columns the raw file has.
+COLUMNS = [
+    'month', 'town', 'flat_type', 'block', 'street_name', 'storey_range',
+    'storey_low', 'storey_high', 'floor_area_sqm', 'flat_model',
+    'lease_commence_date', 'remaining_lease_years', 'resale_price', 'source_file',
+]
+
+# Columns whose string values are normalised to lowercase
+STRING_COLUMNS = ['town', 'flat_type', 'block', 'street_name', 'flat_model']
+
+# Compact dtypes of the cleaned store. Every string column repeats a small set
+# of values (about 2,500 blocks and 550 streets), so all of them are
+# dictionary-encoded, and numbers use the narrowest type that fits HDB data.
+COLUMN_DTYPES = {
+    'town': 'category',
+    'flat_type': 'category',
+    'block': 'category',
+    'street_name': 'category',
+    'storey_range': 'category',
+    'storey_low': 'int8',
+    'storey_high': 'int8',
+    'floor_area_sqm': 'float32',
+    'flat_model': 'category',
+    'lease_commence_date': 'int16',
+    'remaining_lease_years': 'float32',
+    'resale_price': 'int32',
+    'source_file': 'category',
+}
+CATEGORY_COLUMNS = [column for column, dtype in COLUMN_DTYPES.items() if dtype == 'category']
+
+# HDB flats are sold on 99-year leases
+LEASE_YEARS = 99
+
+
+def source_signature(data_dir=DATA_DIR):
+    """Returns (path, mtime, size) for every CSV in the data folder.
+
+    The signature is the cache key for the parsed frame, so touching, replacing
+    or adding a file invalidates the cached data on the next rerun.
+    """
+    signature = []
+    for file in sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+        stat = os.stat(file)
+        signature.append((file, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _parse_remaining_lease(series):
+    # Some releases hold plain integers (years) and newer ones hold strings
+    # such as "61 years 04 months"
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    parts = series.astype(str).str.extract(r'(\d+)\s*years?(?:\s*(\d+)\s*months?)?')
+    years = pd.to_numeric(parts[0], errors='coerce')
+    months = pd.to_numeric(parts[1], errors='coerce').fillna(0)
+    plain = pd.to_numeric(series, errors='coerce')
+    return (years + months / 12).fillna(plain)
+
+
+def clean_data(df, source_file=""):
+    """Cleans one raw release and reconciles it to the store schema."""
+    df.columns = df.columns.str.lower()
+    df['month'] = pd.to_datetime(df['month'], format='%Y-%m')
+    df['resale_price'] = pd.to_numeric(df['resale_price'], errors='coerce')
+    df['floor_area_sqm'] = pd.to_numeric(df['floor_area_sqm'], errors='coerce')
+    df['lease_commence_date'] = pd.to_numeric(df['lease_commence_date'], errors='coerce')
+
+    # Releases before 2015 have no remaining_lease column, so derive it from
+    # the lease commencement year and the transaction month
+    elapsed = df['month'].dt.year + (df['month'].dt.month - 1) / 12 - df['lease_commence_date']
+    derived = LEASE_YEARS - elapsed
+    if 'remaining_lease' in df.columns:
+        df['remaining_lease_years'] = _parse_remaining_lease(df['remaining_lease']).fillna(derived)
+    else:
+        df['remaining_lease_years'] = derived
+
+    # "07 TO 09" -> storey_low 7, storey_high 9
+    storeys = df['storey_range'].str.extract(r'(\d+)\s*TO\s*(\d+)', flags=re.IGNORECASE)
+    df['storey_low'] = pd.to_numeric(storeys[0], errors='coerce').fillna(0)
+    df['storey_high'] = pd.to_numeric(storeys[1], errors='coerce').fillna(0)
+
+    for column in STRING_COLUMNS:
+        df[column] = df[column].str.lower()
+    df['source_file'] = source_file
+
+    # A transaction without a price or lease year is of no use to any page
+    df = df.dropna(subset=['resale_price', 'lease_commence_date'])
+    return df[COLUMNS].astype(COLUMN_DTYPES)
+
+
+def _concat(frames):
+    # Plain pd.concat turns categoricals with different categories into
+    # objects, so union the categories first
+    frames = [frame for frame in frames if frame is not None]
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    df = pd.concat(frames, ignore_index=True)
+    for column in CATEGORY_COLUMNS:
+        if not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
+
+
+def _file_entry(file, mtime, size, df):
+    return {
+        'mtime': mtime,
+        'size': size,
+        'first_month': df['month'].min().strftime('%Y-%m') if len(df) else None,
+        'last_month': df['month'].max().strftime('%Y-%m') if len(df) else None,
+    }
+
+
+def _release_rank(manifest):
+    # Later releases win for the months they cover: rank by the last month a
+    # file covers, then by modification time
+    ordered = sorted(
+        manifest,
+        key=lambda name: (manifest[name]['last_month'] or '', manifest[name]['mtime']),
+    )
+    return {name: rank for rank, name in enumerate(ordered)}
+
+
+def merge_releases(store, new_frames, manifest):
+    """Appends newly cleaned releases to the store.
+
+    Where releases cover the same months, whether already in the store or
+    added together, the rows of the highest ranked release replace the others
+    for those months only, so overlapping data.gov.sg releases do not double
+    count transactions. The result does not depend on the order of ingestion.
+    """
+    new = _concat(new_frames)
+    combined = new if store is None or store.empty else _concat([store, new])
+
+    # Months covered by more than one release, among the new releases as well
+    # as between them and the store. The store is already deduplicated, so
+    # only months the new releases cover can overlap.
+    candidates = combined.loc[combined['month'].isin(new['month'].unique()), ['month', 'source_file']]
+    sources = candidates.groupby('month')['source_file'].nunique()
+    overlap_months = sources.index[sources > 1]
+
+    if len(overlap_months) > 0:
+        rank = _release_rank(manifest)
+        in_overlap = combined['month'].isin(overlap_months)
+        overlap = combined.loc[in_overlap, ['month', 'source_file']]
+        overlap_rank = overlap['source_file'].astype(str).map(rank)
+        winner = overlap_rank.groupby(overlap['month']).transform('max')
+        combined = combined.drop(index=overlap.index[overlap_rank != winner])
+
+    # The store is kept in month order, which query_engine relies on to turn
+    # date filters into contiguous slices
+    return combined.sort_values('month', kind='stable', ignore_index=True)
+
+
+def write_frame(df, path, metadata=None):
+    """Writes a frame to an uncompressed Arrow IPC file, atomically."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata.update(metadata or {})
+    table = table.replace_schema_metadata(schema_metadata)
+
+    # Write to a temporary file first so other processes never map a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def map_frame(path, split_blocks=False):
+    """Memory-maps an Arrow IPC file, returning (frame, schema metadata).
+
+    With split_blocks=True numeric columns can stay views onto the mapped
+    file, so processes mapping the same file share those pages.
+    """
+    with pa.memory_map(path, 'r') as source:
+        reader = pa.ipc.open_file(source)
+        metadata = reader.schema.metadata or {}
+        return reader.read_all().to_pandas(split_blocks=split_blocks), metadata
+
+
+def write_snapshot(df, manifest, path):
+    """Writes the cleaned store to an Arrow snapshot tagged with its sources."""
+    write_frame(df, path, {
+        b'manifest': json.dumps(manifest).encode('utf-8'),
+        b'version': str(SNAPSHOT_VERSION).encode('utf-8'),
+    })
+
+
+def read_snapshot(path):
+    """Memory-maps a snapshot, returning (frame, manifest) or (None, {})."""
+    if not os.path.exists(path):
+        return None, {}
+    try:
+        df, metadata = map_frame(path)
+        if metadata.get(b'version') != str(SNAPSHOT_VERSION).encode('utf-8'):
+            return None, {}
+        return df, json.loads(metadata.get(b'manifest', b'{}'))
+    except (OSError, ValueError, pa.ArrowInvalid):
+        return None, {}
+
+
+def ingest(signature, data_dir=DATA_DIR):
+    """Brings the snapshot up to date with the CSVs in a source signature.
+
+    Only files that are not in the snapshot yet are parsed and cleaned. If a
+    file already ingested was modified or removed the store is rebuilt from
+    every CSV, since its rows may have replaced months of other releases.
+    Returns (frame, names of the files that were parsed).
+    """
+    path = os.path.join(data_dir, SNAPSHOT_NAME)
+    store, manifest = read_snapshot(path)
+
+    current = {os.path.basename(file): (file, mtime, size) for file, mtime, size in signature}
+    unchanged = all(
+        name in current and current[name][1:] == (entry['mtime'], entry['size'])
+        for name, entry in manifest.items()
+    )
+    if store is None or not unchanged:
+        store, manifest = None, {}
+
+    new_files = [current[name] for name in sorted(current) if name not in manifest]
+    if not new_files:
+        return store, []
+
+    new_frames = []
+    for file, mtime, size in new_files:
+        name = os.path.basename(file)
+        frame = clean_data(pd.read_csv(file), name)
+        manifest[name] = _file_entry(file, mtime, size, frame)
+        new_frames.append(frame)
+
+    store = merge_releases(store, new_frames, manifest)
+    try:
+        write_snapshot(store, manifest, path)
+    except OSError:
+        # A read-only deployment still works, it just parses on every cold start
+        pass
+    return store, [os.path.basename(file) for file, _, _ in new_files]
+
+
+def read_data(signature, data_dir=DATA_DIR):
+    """Returns the cleaned frame, ingesting any CSVs the snapshot lacks."""
+    df, _ = ingest(signature, data_dir)
+    return df
+
+
+@st.cache_resource(show_spinner="Loading HDB resale data...", max_entries=1)
+def _load_cached(signature, data_dir):
+    return read_data(signature, data_dir)
+
+
+def load_data(data_dir=DATA_DIR):
+    """Returns the cleaned resale DataFrame, parsed once per process.
+
+    The frame is shared by every session, so callers must treat it as
+    read-only and filter into new frames instead of modifying it in place.
+    """
+    return _load_cached(source_signature(data_dir), data_dir)
+
+
+# Structures derived from a frame (aggregates, indexes), keyed on the frame
+# object. Values must not hold a strong reference to the frame, or it could
+# never be collected.
+_derived = {}
+_derived_lock = threading.Lock()
+
+
+def _release(frame_id):
+    # Runs when a frame is garbage collected: drops everything derived from it
+    # and closes what holds resources, such as a query executor's worker pool
+    with _derived_lock:
+        values = [_derived.pop(key)[1] for key in list(_derived) if key[0] == frame_id]
+    for value in values:
+        if callable(getattr(type(value), 'close', None)):
+            value.close()
+
+
+def derived(df, name, build):
+    """Returns build(df), computing it only once for a given frame object.
+
+    load_data returns one frame per set of source files, so derived values
+    are built once per data version. They are dropped, and closed if they
+    have a close method, once the frame itself is garbage collected.
+    """
+    key = (id(df), name)
+    with _derived_lock:
+        entry = _derived.get(key)
+        if entry is not None and entry[0]() is df:
+            return entry[1]
+
+    value = build(df)
+    with _derived_lock:
+        entry = _derived.get(key)
+        if entry is not None and entry[0]() is df:
+            # Built concurrently by another thread; keep the first
+            duplicate, value = value, entry[1]
+        else:
+            duplicate = None
+            if not any(frame_id == id(df) for frame_id, _ in _derived):
+                weakref.finalize(df, _release, id(df))
+            _derived[key] = (weakref.ref(df), value)
+    if duplicate is not None and callable(getattr(type(duplicate), 'close', None)):
+        duplicate.close()
+    return value
+
+
+def _rss_mb():
+    # Current resident set size of this process, falling back to the peak
+    # (ru_maxrss, in KB) where /proc is not available
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def memory_report(df):
+    """Returns the deep memory usage of each column of a frame, in MB."""
+    usage = df.memory_usage(deep=True, index=False) / 1024 ** 2
+    report = pd.DataFrame({'dtype': df.dtypes.astype(str), 'mb': usage.round(2)})
+    report.loc['total'] = ['', usage.sum().round(2)]
+    return report
+
+
+def legacy_frame(signature):
+    """Builds the frame the way the pages did before the shared store.
+
+    Object strings and 64-bit numbers, kept only to compare memory usage.
+    """
+    df = pd.concat([pd.read_csv(file) for file, _, _ in signature], ignore_index=True)
+    df.columns = df.columns.str.lower()
+    df['month'] = pd.to_datetime(df['month'], format='%Y-%m')
+    for column in df.select_dtypes(exclude=['number', 'datetime']).columns:
+        df[column] = df[column].astype(object)
+    for column in STRING_COLUMNS:
+        df[column] = df[column].str.lower()
+    return df
+
+
+def print_memory_report(data_dir=DATA_DIR):
+    signature = source_signature(data_dir)
+    rss_start = _rss_mb()
+    compact = read_data(signature, data_dir)
+    rss_compact = _rss_mb()
+    legacy = legacy_frame(signature)
+    rss_legacy = _rss_mb()
+
+    print("Legacy representation (object strings, 64-bit numbers):")
+    print(memory_report(legacy).to_string())
+    print("\nCompact representation:")
+    print(memory_report(compact).to_string())
+    print(f"\nRSS: {rss_start:.1f} MB at start, +{rss_compact - rss_start:.1f} MB for the compact frame, "
+          f"+{rss_legacy - rss_compact:.1f} MB for the legacy frame")
+    print("Each Streamlit session used to hold its own legacy frame; the compact "
+          "frame is held once per process.")
+
+
+if __name__ == "__main__":
+    if "--memory" in sys.argv:
+        print_memory_report()
+    else:
+        # Run after dropping a new release into data/ to ingest it ahead of time
+        df, parsed = ingest(source_signature())
+        print(f"Parsed {len(parsed)} new file(s): {', '.join(parsed) or 'none'}")
+        print(f"Store holds {len(df):,} transactions from {df['month'].min():%Y-%m} to {df['month'].max():%Y-%m}")
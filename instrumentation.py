@@ -0,0 +1,212 @@
+import contextvars
+import hmac
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+
+import streamlit as st
+
+LOG_DIR = "logs"
+EVENTS_PATH = os.path.join(LOG_DIR, "timings.jsonl")
+SUMMARY_PATH = os.path.join(LOG_DIR, "latency_summary.json")
+
+# Durations kept per stage for the percentiles, process-wide and per session
+SAMPLES = 2000
+SESSION_SAMPLES = 200
+# Sessions whose timings are kept, most recently active first
+MAX_SESSIONS = 200
+# The summary file is rewritten at most this often
+SUMMARY_INTERVAL_SECONDS = 30
+# The event log rolls over at this size, keeping a few old files
+EVENTS_MAX_BYTES = 10 * 1024 ** 2
+EVENTS_BACKUPS = 3
+
+PERCENTILES = {'p50': 0.5, 'p90': 0.9, 'p95': 0.95, 'p99': 0.99}
+
+# Names of the spans open in the current thread, outermost first
+_open_spans = contextvars.ContextVar('open_spans', default=())
+
+
+def _session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except ImportError:
+        ctx = None
+    return ctx.session_id if ctx is not None else "no-session"
+
+
+def _summarize(samples):
+    ordered = sorted(samples)
+    summary = {'count': len(ordered), 'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2)}
+    for name, fraction in PERCENTILES.items():
+        summary[f"{name}_ms"] = round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+    return summary
+
+
+class Timings:
+    """Process-wide store of span durations, per stage and per session.
+
+    Every span is appended to a rotating JSON lines log, and a summary of
+    the latency percentiles is rewritten periodically, so a slow page can
+    be traced to the stage that took the time.
+    """
+
+    def __init__(self, log_dir=LOG_DIR):
+        self.events_path = os.path.join(log_dir, os.path.basename(EVENTS_PATH))
+        self.summary_path = os.path.join(log_dir, os.path.basename(SUMMARY_PATH))
+        self._lock = threading.Lock()
+        self._stages = defaultdict(lambda: deque(maxlen=SAMPLES))
+        self._sessions = OrderedDict()
+        self._summary_written = 0.0
+
+        self._log = logging.getLogger(f"{__name__}.events.{id(self)}")
+        self._log.propagate = False
+        self._log.setLevel(logging.INFO)
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                self.events_path, maxBytes=EVENTS_MAX_BYTES, backupCount=EVENTS_BACKUPS)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._log.addHandler(handler)
+        except OSError:
+            # A read-only deployment keeps the in-memory timings and the panel
+            self._log.addHandler(logging.NullHandler())
+
+    def record(self, stage, seconds, session_id, **fields):
+        with self._lock:
+            self._stages[stage].append(seconds)
+            stages = self._sessions.pop(session_id, None) or defaultdict(lambda: deque(maxlen=SESSION_SAMPLES))
+            stages[stage].append(seconds)
+            self._sessions[session_id] = stages
+            while len(self._sessions) > MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+        self._log.info(json.dumps({
+            'time': round(time.time(), 3),
+            'session': session_id,
+            'stage': stage,
+            'ms': round(seconds * 1000, 3),
+            **fields,
+        }, default=str))
+        if time.monotonic() - self._summary_written > SUMMARY_INTERVAL_SECONDS:
+            self.write_summary()
+
+    def aggregate(self):
+        """Latency percentiles per stage over every session."""
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._stages.items() if values}
+        return {stage: _summarize(values) for stage, values in sorted(samples.items())}
+
+    def session(self, session_id):
+        """Latency percentiles per stage for one session."""
+        with self._lock:
+            stages = self._sessions.get(session_id, {})
+            samples = {stage: list(values) for stage, values in stages.items() if values}
+        return {stage: _summarize(values) for stage, values in sorted(samples.items())}
+
+    def write_summary(self):
+        with self._lock:
+            self._summary_written = time.monotonic()
+            session_ids = list(self._sessions)
+        summary = {
+            'written': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'aggregate': self.aggregate(),
+            'sessions': {session_id: self.session(session_id) for session_id in session_ids},
+        }
+        try:
+            tmp_path = self.summary_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(summary, f, indent=2)
+            os.replace(tmp_path, self.summary_path)
+        except OSError:
+            pass
+
+
+@st.cache_resource
+def timings():
+    """The process-wide timings shared by every page and session."""
+    return Timings()
+
+
+@contextmanager
+def span(stage, **fields):
+    """Times the block as stage, e.g. with span('load'): ...
+
+    Spans nest: the event log records the enclosing spans of each one.
+    fields are added to its log entry.
+    """
+    parents = _open_spans.get()
+    token = _open_spans.set(parents + (stage,))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _open_spans.reset(token)
+        timings().record(stage, seconds, _session_id(), parent='/'.join(parents) or None, **fields)
+
+
+def timed_iter(stage, iterable, **fields):
+    """Yields from iterable, timing only the waits for its next item.
+
+    Time the consumer spends between items, such as rendering or running
+    queries, is not counted; the time to the first item is logged as well.
+    """
+    parent = '/'.join(_open_spans.get()) or None
+    waited = 0.0
+    first = None
+    started = time.perf_counter()
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                waited += time.perf_counter() - start
+                break
+            now = time.perf_counter()
+            waited += now - start
+            if first is None:
+                first = now - started
+            yield item
+    finally:
+        session_id = _session_id()
+        timings().record(stage, waited, session_id, parent=parent, **fields)
+        if first is not None:
+            timings().record(f"{stage}.first_item", first, session_id, **fields)
+
+
+def is_admin():
+    """Whether the URL carries the admin token (?admin=<ADMIN_TOKEN secret>)."""
+    try:
+        token = st.secrets.get("ADMIN_TOKEN")
+    except FileNotFoundError:
+        return False
+    given = st.query_params.get("admin")
+    return bool(token) and given is not None and hmac.compare_digest(str(given), str(token))
+
+
+def timing_panel():
+    """Sidebar table of this session's and all sessions' stage latencies, for admins only."""
+    if not is_admin():
+        return
+    # Imported here so the login and Main pages do not load pandas
+    import pandas as pd
+    with st.sidebar.expander("Timings"):
+        store = timings()
+        for title, stats in (("This session", store.session(_session_id())), ("All sessions", store.aggregate())):
+            st.write(title)
+            if stats:
+                table = pd.DataFrame(stats).T[['count', 'p50_ms', 'p95_ms', 'p99_ms']]
+                st.dataframe(table, width="stretch")
+            else:
+                st.write("No timings yet.")
+        if st.button("Write latency summary"):
+            store.write_summary()
+            st.write(f"Written to {store.summary_path}")
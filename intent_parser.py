@@ -0,0 +1,325 @@
+import difflib
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from data_store import derived
+from query_engine import query_engine
+
+# Statistic asked for, by the words that ask for it (checked in this order)
+STAT_WORDS = [
+    ('median', r'\bmedian\b'),
+    ('max', r'\b(highest|max|maximum|most expensive|priciest)\b'),
+    ('min', r'\b(lowest|min|minimum|cheapest|least expensive)\b'),
+    ('count', r'\b(how many|number of|count|volume)\b'),
+    ('mean', r'\b(average|mean|avg|typical)\b'),
+]
+STAT_LABELS = {'mean': 'average', 'median': 'median', 'min': 'lowest', 'max': 'highest', 'count': 'number of'}
+
+PRICE_WORDS = r'\b(price|prices|cost|costs|expensive|cheap|cheapest|priciest|sell for|sold for)\b'
+TRANSACTION_WORDS = r'\b(transactions?|sales|sold|resold|resales?|deals)\b'
+TREND_WORDS = r'\b(trend|trends|over time|over the years|changed?|movement|history)\b'
+# Ranking towns lowest first: by count ("fewest sales") or by price ("cheapest")
+RANK_MIN_WORDS = r'\b(fewest|least|lowest|min|minimum|cheapest|smallest)\b'
+RANK_MAX_WORDS = r'\b(most|highest|max|maximum|priciest|largest|biggest)\b'
+
+# Conditions the parser cannot apply (floor area, price per sqm, storey,
+# lease, street) and open questions. A question with any of these, or with
+# a number that is not a year, goes to the LLM rather than being answered
+# without them; comparisons are only understood by trend charts
+QUALIFIER_WORDS = (r'\b(sqm|sq ?m|sq ?ft|square|psf|psm|per|above|below|under|over(?! time| the years)|'
+                   r'more than|less than|greater than|at least|at most|storeys?|floors?|lease|'
+                   r'streets?|blocks?|roads?)\b')
+OPEN_QUESTION_WORDS = r'\b(why|should|will|would|could|predict|forecast|expect|worth|afford)\b'
+# Dates relative to today, which the data's years cannot resolve
+RELATIVE_DATE_WORDS = (r'\b(last|this|next|past|previous|recent|recently|current|currently|latest|'
+                       r'ago|today|now|decade)\b')
+COMPARISON_WORDS = r'\b(compare[ds]?|comparing|comparison|vs|versus|than|difference|differ)\b'
+
+YEAR = r'(?:19|20)\d{2}'
+YEAR_RANGE = (rf'\b(?:between\s+({YEAR})\s+and\s+({YEAR})|'
+              rf'({YEAR})\s*(?:to|-|–|until|till|through)\s*({YEAR}))\b')
+
+# Towns known by a shorter or older name
+TOWN_ALIASES = {'amk': 'ang mo kio', 'kallang': 'kallang/whampoa', 'whampoa': 'kallang/whampoa',
+                'cck': 'choa chu kang', 'central': 'central area', 'city': 'central area'}
+
+# Fuzzy matching only looks at words at least this long, at this similarity
+FUZZY_MIN_LENGTH = 5
+FUZZY_CUTOFF = 0.85
+
+
+def build_vocabulary(df):
+    """Towns, flat types and flat models as they appear in the data."""
+    engine = query_engine(df)
+    flat_types = engine.categories('flat_type')
+    return {
+        'town': engine.categories('town'),
+        'flat_type': flat_types,
+        # '2-room' is a flat model as well as a flat type; leave it to the type
+        'flat_model': [model for model in engine.categories('flat_model') if 'room' not in model],
+        'years': (int(df['month'].min().year), int(df['month'].max().year)),
+    }
+
+
+def query_vocabulary(df):
+    """The vocabulary of a frame (cached, see data_store.derived)."""
+    return derived(df, 'query_vocabulary', build_vocabulary)
+
+
+def _phrase_pattern(phrase):
+    return r'(?<![\w-])' + re.escape(phrase).replace(r'\ ', r'[\s-]+') + r'(?![\w-])'
+
+
+def _match_phrases(text, phrases):
+    # Exact phrase matches, longest first so "jurong west" wins over a shorter
+    # name inside it; matched text is blanked out so it is not matched twice
+    found = []
+    for phrase in sorted(phrases, key=len, reverse=True):
+        pattern = _phrase_pattern(phrase)
+        if re.search(pattern, text):
+            found.append(phrase)
+            text = re.sub(pattern, ' ', text)
+    return found, text
+
+
+def _fuzzy_towns(text, towns):
+    # Town names with a typo ("tampinez", "yishum"), compared word n-grams
+    words = re.findall(r'[a-z/]+', text)
+    found = []
+    for size in (3, 2, 1):
+        for i in range(len(words) - size + 1):
+            phrase = ' '.join(words[i:i + size])
+            if len(phrase) < FUZZY_MIN_LENGTH:
+                continue
+            match = difflib.get_close_matches(phrase, towns, n=1, cutoff=FUZZY_CUTOFF)
+            if match and match[0] not in found:
+                found.append(match[0])
+    return found
+
+
+def _parse_years(text, first_year, last_year):
+    # Ranges are "2013 to 2015" or "between 2013 and 2015"; a bare "2013 and
+    # 2015" is the two years only. Returns the years and the text without them
+    years = set()
+    for pair in re.findall(YEAR_RANGE, text):
+        low, high = sorted(int(year) for year in pair if year)
+        years.update(range(low, high + 1))
+    text = re.sub(YEAR_RANGE, ' ', text)
+
+    for word, year in re.findall(rf'\b(since|after|from|before)\s+({YEAR})\b', text):
+        year = int(year)
+        if word == 'before':
+            years.update(range(first_year, year))
+        else:
+            years.update(range(year + (word == 'after'), last_year + 1))
+    text = re.sub(rf'\b(?:since|after|from|before)\s+{YEAR}\b', ' ', text)
+
+    years.update(int(year) for year in re.findall(rf'\b({YEAR})\b', text))
+    return sorted(years), re.sub(rf'\b{YEAR}\b', ' ', text)
+
+
+def parse_query(text, vocabulary):
+    """Extracts the intent and slots of a question about resale prices.
+
+    Returns a dict with 'intent' ('price_stat', 'count', 'trend',
+    'rank_towns' or None when the question needs the LLM), 'stat', 'rank'
+    (for rank_towns, 'max' or 'min'), and the 'towns', 'flat_types',
+    'flat_models' and 'years' mentioned.
+    """
+    text = text.lower()
+
+    flat_types = []
+    for rooms in re.findall(r'\b(\d)\s*-?\s*(?:room|rm)s?\b', text):
+        flat_type = f"{rooms} room"
+        if flat_type in vocabulary['flat_type'] and flat_type not in flat_types:
+            flat_types.append(flat_type)
+    text = re.sub(r'\b\d\s*-?\s*(?:room|rm)s?\b', ' ', text)
+    other_types, text = _match_phrases(text, [t for t in vocabulary['flat_type'] if 'room' not in t])
+    flat_types += other_types
+    if re.search(r'\bexec\b', text) and 'executive' in vocabulary['flat_type']:
+        flat_types.append('executive')
+
+    towns, text = _match_phrases(text, vocabulary['town'])
+    for alias, town in TOWN_ALIASES.items():
+        if town in vocabulary['town'] and town not in towns and re.search(_phrase_pattern(alias), text):
+            towns.append(town)
+    if not towns:
+        towns = _fuzzy_towns(text, vocabulary['town'])
+
+    flat_models, text = _match_phrases(text, vocabulary['flat_model'])
+    years, text = _parse_years(text, *vocabulary['years'])
+
+    stat = next((name for name, pattern in STAT_WORDS if re.search(pattern, text)), None)
+    asks_price = bool(re.search(PRICE_WORDS, text))
+    asks_transactions = bool(re.search(TRANSACTION_WORDS, text))
+    asks_town = bool(re.search(r'\b(which|what) (town|area|estate)s?\b', text))
+    unhandled = (re.search(QUALIFIER_WORDS, text) or re.search(OPEN_QUESTION_WORDS, text) or
+                 re.search(RELATIVE_DATE_WORDS, text) or re.search(r'\d', text) or
+                 re.search(r'\bwhich\b', text) and not asks_town)
+
+    intent = None
+    rank = None
+    if unhandled:
+        pass
+    elif re.search(TREND_WORDS, text) and (asks_price or not asks_transactions):
+        # One line per town or flat type, so "bedok vs tampines" is understood
+        intent = 'trend'
+    elif re.search(COMPARISON_WORDS, text):
+        pass
+    elif asks_town and (asks_price or asks_transactions or re.search(RANK_MAX_WORDS, text)):
+        # Towns are ranked by transaction count, or by their average (median
+        # if asked) price, highest first unless the fewest or cheapest is
+        # asked for; a question asking for both, or neither, needs the LLM
+        lowest = bool(re.search(RANK_MIN_WORDS, text))
+        if lowest != bool(re.search(RANK_MAX_WORDS, text)):
+            intent = 'rank_towns'
+            rank = 'min' if lowest else 'max'
+            if not asks_price:
+                stat = 'count'
+            else:
+                stat = 'median' if stat == 'median' else 'mean'
+    elif stat == 'count' and asks_transactions and not asks_price:
+        # Only counts of sales: "how many rooms does an executive flat have"
+        # is not one, and goes to the LLM
+        intent = 'count'
+    elif asks_price and stat != 'count' and (stat or towns or flat_types or years):
+        intent = 'price_stat'
+        stat = stat or 'mean'
+
+    return {
+        'intent': intent,
+        'stat': stat,
+        'rank': rank,
+        'towns': towns,
+        'flat_types': flat_types,
+        'flat_models': flat_models,
+        'years': years,
+    }
+
+
+def describe_filters(parsed):
+    # e.g. "4 room / 5 room model a flats in bedok in 2013-2015"
+    parts = [' / '.join(parsed[slot]) for slot in ('flat_types', 'flat_models') if parsed[slot]]
+    parts.append("flats")
+    if parsed['towns']:
+        parts.append("in " + ', '.join(parsed['towns']))
+    years = parsed['years']
+    if years:
+        if len(years) > 1 and years == list(range(years[0], years[-1] + 1)):
+            parts.append(f"in {years[0]}-{years[-1]}")
+        else:
+            parts.append("in " + ', '.join(str(year) for year in years))
+    return ' '.join(parts)
+
+
+def matching_rows(df, parsed):
+    """Row positions (None for every row) of the transactions a question is about."""
+    return query_engine(df).rows(
+        flat_type=parsed['flat_types'] or None,
+        town=parsed['towns'] or None,
+        flat_model=parsed['flat_models'] or None,
+        year=parsed['years'] or None,
+        exact=True,
+    )
+
+
+def _statistic(prices, stat):
+    return {'mean': np.mean, 'median': np.median, 'min': np.min, 'max': np.max}[stat](prices)
+
+
+def answer_query(df, parsed):
+    """Answers a parsed question from the data. Not used for trends, which are charted."""
+    engine = query_engine(df)
+    rows = matching_rows(df, parsed)
+    scope = describe_filters(parsed)
+    count = engine.size if rows is None else len(rows)
+    if count == 0:
+        return f"No records found for {scope}."
+
+    if parsed['intent'] == 'count':
+        return f"There were {count:,} resale transactions for {scope}."
+
+    if parsed['intent'] == 'rank_towns':
+        towns = engine.frame(rows)['town']
+        if parsed['stat'] == 'count':
+            # Towns with no transactions matching are left out of the ranking
+            ranking = towns.value_counts(ascending=parsed['rank'] == 'min')
+            ranking = ranking[ranking > 0]
+            top = ranking.index[0]
+            most = 'fewest' if parsed['rank'] == 'min' else 'most'
+            return (f"{top} has the {most} resale transactions ({ranking.iloc[0]:,}) for {scope}. "
+                    f"Next: " + ', '.join(f"{town} ({n:,})" for town, n in ranking.iloc[1:4].items()) + ".")
+        prices = pd.Series(engine.values('resale_price', rows))
+        by_town = prices.groupby(towns.to_numpy()).agg(parsed['stat'])
+        top = by_town.idxmin() if parsed['rank'] == 'min' else by_town.idxmax()
+        return (f"{top} has the {STAT_LABELS[parsed['rank']]} {STAT_LABELS[parsed['stat']]} resale price "
+                f"(SGD {by_town[top]:,.2f}) for {scope}.")
+
+    prices = engine.values('resale_price', rows)
+    value = _statistic(prices, parsed['stat'])
+    return (f"The {STAT_LABELS[parsed['stat']]} resale price for {scope} is SGD {value:,.2f} "
+            f"(from {count:,} transactions).")
+
+
+# Questions used to compare the routed path with the LLM path
+BENCHMARK_QUESTIONS = [
+    "What is the average resale price for 4-room flats in bedok in 2015?",
+    "median price of 5 room flats in tampinez from 2013 to 2015",
+    "What is the cheapest executive flat in woodlands?",
+    "How many transactions were there in 2014?",
+    "Which town has the most transactions?",
+    "Which town is the most expensive for 3 room flats?",
+    "Price trend for 4 room flats in punggol and sengkang",
+]
+
+
+def benchmark_routing(df, questions=BENCHMARK_QUESTIONS, llm=None, repeat=20):
+    """Times answering questions without the LLM, and optionally with it.
+
+    llm(question) should run the LLM path for a question; it is called once
+    per question. Returns a frame of per-question latencies in milliseconds.
+    """
+    vocabulary = query_vocabulary(df)
+    rows = []
+    for question in questions:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            parsed = parse_query(question, vocabulary)
+            if parsed['intent'] not in (None, 'trend'):
+                answer_query(df, parsed)
+            elif parsed['intent'] == 'trend':
+                matching_rows(df, parsed)
+        routed_ms = (time.perf_counter() - start) / repeat * 1000
+
+        llm_ms = float('nan')
+        if llm is not None:
+            start = time.perf_counter()
+            llm(question)
+            llm_ms = (time.perf_counter() - start) * 1000
+        rows.append({'question': question, 'intent': parsed['intent'],
+                     'routed_ms': round(routed_ms, 2), 'llm_ms': round(llm_ms, 1)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    # python intent_parser.py [--llm]: routed latency per question, and with
+    # --llm the latency of an uncached gpt-4o-mini round trip for comparison
+    from data_store import load_data
+    df = load_data()
+    llm = None
+    if "--llm" in sys.argv:
+        from general_query import build_llm_prompt, extract_data_summary
+        from llm_cache import chat_completion
+        summary = extract_data_summary(df)
+
+        def llm(question):
+            messages = [{"role": "system", "content": build_llm_prompt(df, summary, question)},
+                        {"role": "user", "content": question}]
+            return chat_completion("gpt-4o-mini", messages)
+
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_colwidth', 70)
+    print(benchmark_routing(df, llm=llm).to_string(index=False))
@@ -0,0 +1,165 @@
+import streamlit as st
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from llm_gateway import llm_gateway
+
+CACHE_PATH = os.path.join(".cache", "llm_responses.sqlite3")
+
+# Responses older than this are treated as misses and regenerated
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Least recently used responses are evicted beyond this many entries
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def normalize_prompt(text):
+    """Lowercases a prompt and collapses whitespace, so trivially different
+    phrasings of the same prompt share a cache entry."""
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def cache_key(model, messages):
+    """Hash of the model and the normalized role/content of every message."""
+    normalized = [[message['role'], normalize_prompt(message['content'])] for message in messages]
+    payload = json.dumps([model, normalized], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """Persistent cache of chat completion texts in a SQLite file.
+
+    Entries expire after ttl seconds and the least recently used ones are
+    evicted beyond max_entries. Safe to share between threads, and between
+    processes through SQLite's own locking.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT,"
+            " created REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Returns the cached response for a key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, model, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            # Drop expired entries, then the least recently used beyond the cap
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def get_or_create(self, model, messages, create):
+        """Returns the cached completion for the prompt, calling create on a miss.
+
+        create(model, messages) must return the completion text, so tests can
+        pass a stub instead of the OpenAI client.
+        """
+        key = cache_key(model, messages)
+        response = self.get(key)
+        if response is None:
+            response = create(model, messages)
+            self.set(key, model, response)
+        return response
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = self.misses = 0
+
+
+@st.cache_resource
+def llm_cache():
+    """The process-wide response cache shared by every page and session."""
+    return LLMCache()
+
+
+def chat_completion(model, messages):
+    """Calls the OpenAI chat completion API through the gateway and returns the response text."""
+    return llm_gateway().complete(model, messages)
+
+
+def cached_chat_completion(model, messages):
+    """chat_completion, answered from the response cache when possible."""
+    return llm_cache().get_or_create(model, messages, chat_completion)
+
+
+def stream_chat_completion(model, messages):
+    """Streams a chat completion from the OpenAI API, yielding text deltas.
+
+    Requests go through the shared gateway (see llm_gateway), whose endpoint
+    follows openai.api_base (OPENAI_API_BASE), so a local stand-in server can
+    replace the real API.
+    """
+    yield from llm_gateway().stream(model, messages)
+
+
+def cached_stream_chat_completion(model, messages, stream=stream_chat_completion):
+    """Yields a cached response in one piece, or streams and caches a new one.
+
+    The response is only cached once the stream completes, so an interrupted
+    stream is never stored as a truncated answer.
+    """
+    cache = llm_cache()
+    key = cache_key(model, messages)
+    response = cache.get(key)
+    if response is not None:
+        yield response
+        return
+
+    parts = []
+    for delta in stream(model, messages):
+        parts.append(delta)
+        yield delta
+    cache.set(key, model, ''.join(parts))
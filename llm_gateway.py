@@ -0,0 +1,329 @@
+import asyncio
+import json
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import aiohttp
+import openai
+import streamlit as st
+
+# At most this many requests are sent to the API at once, process-wide
+MAX_CONCURRENCY = 8
+# Seconds allowed for a whole completion, or for each chunk of a stream
+CALL_TIMEOUT = 60
+# Seconds a call may wait for a free slot before it is refused
+QUEUE_TIMEOUT = 30
+# Retries of rate limited (429) and server (5xx) errors, with exponential backoff
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 8
+# Latencies kept for the percentiles in stats()
+LATENCY_SAMPLES = 1000
+
+RETRYABLE_ERRORS = (openai.error.RateLimitError, openai.error.ServiceUnavailableError,
+                    openai.error.APIConnectionError, openai.error.TryAgain)
+
+
+class LLMUnavailable(RuntimeError):
+    """Raised when a completion fails after retries, times out or cannot get a slot.
+
+    The message is meant to be shown to the user as is.
+    """
+
+
+def _retryable(error):
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return isinstance(error, openai.error.APIError) and (error.http_status or 0) >= 500
+
+
+def _backoff(attempt, base, cap):
+    # Exponential backoff with full jitter, so retrying sessions spread out
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _prompt_key(model, messages):
+    # Identical requests only: unlike the response cache, no normalization
+    return model, json.dumps(messages, sort_keys=True)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _Broadcast:
+    """The deltas of one streamed completion, replayed to every caller waiting on it.
+
+    Only touched from the gateway's event loop thread.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def publish(self, delta):
+        self.parts.append(delta)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        position = 0
+        while True:
+            while position < len(self.parts):
+                yield self.parts[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class LLMGateway:
+    """Shared, bounded client for the OpenAI chat completion API.
+
+    Requests run as coroutines on an event loop in a background thread,
+    through one pooled aiohttp session, so a slow completion holds a socket
+    rather than a server thread. The gateway caps concurrent requests with a
+    semaphore, applies a timeout to every call, and retries 429 and 5xx
+    errors with exponential backoff. Identical prompts already in flight
+    are coalesced into one request. The endpoint follows openai.api_base
+    (OPENAI_API_BASE), so a local stand-in server can replace the real API.
+    """
+
+    def __init__(self, api_key=None, max_concurrency=MAX_CONCURRENCY, timeout=CALL_TIMEOUT,
+                 queue_timeout=QUEUE_TIMEOUT, max_retries=MAX_RETRIES, backoff=BACKOFF_SECONDS,
+                 max_backoff=MAX_BACKOFF_SECONDS):
+        # None falls back to openai.api_key (the OPENAI_API_KEY environment variable)
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._metrics_lock = threading.Lock()
+        self._counters = dict.fromkeys(['calls', 'coalesced', 'retries', 'errors', 'timeouts', 'refused',
+                                        'prompt_tokens', 'completion_tokens'], 0)
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._first_token = deque(maxlen=LATENCY_SAMPLES)
+        self._active = 0
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+        # Futures of completions and broadcasts of streams in flight, by prompt
+        self._inflight = {}
+        asyncio.run_coroutine_threadsafe(self._open(), self._loop).result()
+
+    async def _open(self):
+        # The session and semaphore belong to the gateway's loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        self._session = aiohttp.ClientSession(connector=connector)
+
+    def _count(self, name, amount=1):
+        with self._metrics_lock:
+            self._counters[name] += amount
+
+    def _record(self, started, first_token=None, usage=None):
+        with self._metrics_lock:
+            self._latencies.append(time.monotonic() - started)
+            if first_token is not None:
+                self._first_token.append(first_token - started)
+            if usage:
+                self._counters['prompt_tokens'] += usage.get('prompt_tokens', 0)
+                self._counters['completion_tokens'] += usage.get('completion_tokens', 0)
+
+    async def _slot(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._count('refused')
+            raise LLMUnavailable("The language model is busy right now, please try again in a moment.")
+        with self._metrics_lock:
+            self._active += 1
+
+    def _release(self):
+        with self._metrics_lock:
+            self._active -= 1
+        self._semaphore.release()
+
+    async def _with_retries(self, attempt_call):
+        # Runs attempt_call() until it succeeds, retrying the errors worth retrying
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await attempt_call()
+            except asyncio.TimeoutError:
+                self._count('timeouts')
+                raise LLMUnavailable(f"The language model did not respond within {self.timeout}s.")
+            except openai.error.OpenAIError as e:
+                if not _retryable(e) or attempt == self.max_retries:
+                    self._count('errors')
+                    if _retryable(e):
+                        raise LLMUnavailable("The language model is overloaded, please try again later.") from e
+                    raise
+                self._count('retries')
+                await asyncio.sleep(_backoff(attempt, self.backoff, self.max_backoff))
+
+    async def _request_completion(self, model, messages):
+        openai.aiosession.set(self._session)
+        started = time.monotonic()
+        await self._slot()
+        try:
+            async def attempt():
+                return await asyncio.wait_for(
+                    openai.ChatCompletion.acreate(model=model, messages=messages, api_key=self.api_key),
+                    self.timeout)
+            response = await self._with_retries(attempt)
+        finally:
+            self._release()
+        self._record(started, usage=response.get('usage'))
+        return response['choices'][0]['message']['content']
+
+    async def _complete(self, model, messages):
+        self._count('calls')
+        key = ('complete',) + _prompt_key(model, messages)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._count('coalesced')
+            return await asyncio.shield(inflight)
+
+        task = asyncio.ensure_future(self._request_completion(model, messages))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _produce_stream(self, model, messages, broadcast):
+        openai.aiosession.set(self._session)
+        started = time.monotonic()
+        first_token = None
+        usage = None
+        try:
+            await self._slot()
+        except LLMUnavailable as e:
+            broadcast.finish(e)
+            return
+        try:
+            async def attempt():
+                nonlocal first_token, usage
+                chunks = await asyncio.wait_for(
+                    openai.ChatCompletion.acreate(model=model, messages=messages, stream=True,
+                                                  api_key=self.api_key),
+                    self.timeout)
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        return
+                    usage = chunk.get('usage') or usage
+                    choices = chunk.get('choices') or [{}]
+                    delta = choices[0].get('delta', {}).get('content')
+                    if delta:
+                        first_token = first_token or time.monotonic()
+                        broadcast.publish(delta)
+
+            # A stream is only retried before its first delta; after that the
+            # caller has already shown part of the answer
+            async def attempt_once_started():
+                try:
+                    return await attempt()
+                except openai.error.OpenAIError:
+                    if broadcast.parts:
+                        self._count('errors')
+                        raise LLMUnavailable("The response was interrupted, please try again.")
+                    raise
+            await self._with_retries(attempt_once_started)
+            self._record(started, first_token, usage)
+            broadcast.finish()
+        except Exception as e:
+            broadcast.finish(e)
+        finally:
+            self._release()
+
+    async def _stream(self, model, messages, deltas):
+        # Pushes the deltas of a (possibly shared) stream onto a thread-safe queue
+        try:
+            self._count('calls')
+            key = ('stream',) + _prompt_key(model, messages)
+            broadcast = self._inflight.get(key)
+            if broadcast is not None:
+                self._count('coalesced')
+            else:
+                broadcast = _Broadcast()
+                self._inflight[key] = broadcast
+                task = asyncio.ensure_future(self._produce_stream(model, messages, broadcast))
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            async for delta in broadcast.follow():
+                deltas.put((True, delta))
+            deltas.put((True, None))
+        except BaseException as e:
+            deltas.put((False, e))
+
+    def complete(self, model, messages):
+        """Returns the text of a chat completion, blocking the calling thread only."""
+        future = asyncio.run_coroutine_threadsafe(self._complete(model, messages), self._loop)
+        return future.result()
+
+    def stream(self, model, messages):
+        """Yields the text deltas of a streamed chat completion as they arrive."""
+        deltas = queue.Queue()
+        asyncio.run_coroutine_threadsafe(self._stream(model, messages, deltas), self._loop)
+        while True:
+            ok, value = deltas.get()
+            if not ok:
+                raise value
+            if value is None:
+                return
+            yield value
+
+    def stats(self):
+        """Call counts, token usage and latency percentiles (seconds) so far."""
+        with self._metrics_lock:
+            latencies = list(self._latencies)
+            first_token = list(self._first_token)
+            return {
+                **self._counters,
+                'active': self._active,
+                'latency_p50': _percentile(latencies, 0.5),
+                'latency_p95': _percentile(latencies, 0.95),
+                'first_token_p50': _percentile(first_token, 0.5),
+                'first_token_p95': _percentile(first_token, 0.95),
+            }
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def _api_key():
+    # Read when the gateway is first used rather than at import, so pages that
+    # never call the LLM do not need the secret
+    try:
+        return st.secrets.get("OPENAI_API_KEY")
+    except FileNotFoundError:
+        return None
+
+
+@st.cache_resource
+def llm_gateway():
+    """The process-wide gateway shared by every page and session, created on first use."""
+    return LLMGateway(api_key=_api_key())
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+# Mortgage Servicing Ratio: repayments on an HDB flat loan may not exceed 30%
+# of gross monthly income
+MSR = 0.30
+
+# Total Debt Servicing Ratio: all debt repayments together may not exceed 55%
+# of gross monthly income
+TDSR = 0.55
+
+
+def repayment_cap(income, debts, msr=MSR, tdsr=TDSR):
+    """Largest monthly loan repayment allowed under the MSR and TDSR limits."""
+    income = np.asarray(income, dtype=float)
+    debts = np.asarray(debts, dtype=float)
+    return np.clip(np.minimum(msr * income, tdsr * income - debts), 0, None)
+
+
+def annuity_factor(annual_rate, tenure_years):
+    """Present value of a repayment of 1 per month over the tenure.
+
+    Works element-wise on arrays, and falls back to the number of months when
+    the rate is zero.
+    """
+    monthly_rate = np.asarray(annual_rate, dtype=float) / 12
+    months = np.asarray(tenure_years, dtype=float) * 12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = (1 - (1 + monthly_rate) ** -months) / monthly_rate
+    return np.where(monthly_rate == 0, months, factor)
+
+
+def max_loan(income, debts, annual_rate, tenure_years, msr=MSR, tdsr=TDSR):
+    """Largest loan whose annuity repayment fits under the repayment cap.
+
+    All arguments broadcast against each other, so arrays of incomes, rates
+    and tenures give the whole grid of loans in one computation.
+    """
+    return repayment_cap(income, debts, msr, tdsr) * annuity_factor(annual_rate, tenure_years)
+
+
+def monthly_instalment(principal, annual_rate, tenure_years):
+    """Monthly repayment of a fully amortizing loan."""
+    return np.asarray(principal, dtype=float) / annuity_factor(annual_rate, tenure_years)
+
+
+def loan_grid(incomes, debts, rates, tenures, msr=MSR, tdsr=TDSR):
+    """Max loan for every income x rate x tenure, shape (incomes, rates, tenures)."""
+    incomes = np.asarray(incomes, dtype=float)[:, None, None]
+    rates = np.asarray(rates, dtype=float)[None, :, None]
+    tenures = np.asarray(tenures, dtype=float)[None, None, :]
+    return max_loan(incomes, debts, rates, tenures, msr, tdsr)
+
+
+def sensitivity_grid(income, debts, savings, rates, tenures, msr=MSR, tdsr=TDSR):
+    """Flat budget (max loan + savings) for each interest rate and tenure.
+
+    Returns a frame indexed by rate with one column per tenure in years.
+    """
+    budgets = loan_grid([income], debts, rates, tenures, msr, tdsr)[0] + savings
+    return pd.DataFrame(
+        budgets,
+        index=pd.Index(rates, name='interest_rate'),
+        columns=pd.Index(tenures, name='tenure_years'),
+    )
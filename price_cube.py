@@ -0,0 +1,87 @@
+import pandas as pd
+from data_store import derived
+
+# Grain of the cube: one cell per town, flat type, flat model and month
+CUBE_KEYS = ['town', 'flat_type', 'flat_model', 'month']
+QUANTILES = {'p25': 0.25, 'p50': 0.5, 'p75': 0.75}
+
+
+def build_price_cube(df):
+    """Aggregates resale prices into one row per cube cell.
+
+    Each cell holds sum, count, min, max and quartiles of resale_price, so
+    means, counts and extremes of any combination of cells are exact.
+    """
+    grouped = df.groupby(CUBE_KEYS, observed=True)['resale_price']
+    cube = grouped.agg(['sum', 'count', 'min', 'max'])
+    quantiles = grouped.quantile(list(QUANTILES.values())).unstack()
+    quantiles.columns = list(QUANTILES)
+    cube = cube.join(quantiles).reset_index()
+    cube['sum'] = cube['sum'].astype('int64')
+    cube['year'] = cube['month'].dt.year.astype('int16')
+    return cube
+
+
+def price_cube(df):
+    """Returns the cube for a frame (cached, see data_store.derived)."""
+    return derived(df, 'price_cube', build_price_cube)
+
+
+def _matching(categories, value, exact):
+    values = [v.lower() for v in ([value] if isinstance(value, str) else value)]
+    if exact:
+        return values
+    names = categories.astype(str)
+    return [category for category, name in zip(categories, names) if any(v in name for v in values)]
+
+
+def select_cells(cube, flat_type=None, year=None, town=None, flat_model=None, exact=False):
+    """Returns the cube cells matching the filters.
+
+    Text filters take a value or a list of values and match categories by
+    substring like the original str.contains filters, or exactly with
+    exact=True. year is an int or a list of ints.
+    The work is proportional to the number of cells, not transactions.
+    """
+    mask = pd.Series(True, index=cube.index)
+    for column, value in (('flat_type', flat_type), ('town', town), ('flat_model', flat_model)):
+        if value:
+            values = _matching(cube[column].cat.categories, value, exact)
+            mask &= cube[column].isin(values)
+    if year:
+        years = year if isinstance(year, (list, tuple, set)) else [year]
+        mask &= cube['year'].isin(years)
+    return cube[mask]
+
+
+def summarize(cells):
+    """Combines cells into count, mean, min, max and quartiles of resale_price.
+
+    Quartiles are exact for a single cell and a count-weighted blend of the
+    cell quartiles otherwise.
+    """
+    count = cells['count'].sum()
+    if count == 0:
+        return {'count': 0, 'mean': float('nan'), 'min': float('nan'), 'max': float('nan'),
+                **{name: float('nan') for name in QUANTILES}}
+    summary = {
+        'count': int(count),
+        'mean': cells['sum'].sum() / count,
+        'min': cells['min'].min(),
+        'max': cells['max'].max(),
+    }
+    for name in QUANTILES:
+        summary[name] = (cells[name] * cells['count']).sum() / count
+    return summary
+
+
+def mean_price(cube, **filters):
+    """Average resale price for the filters, NaN when nothing matches."""
+    return summarize(select_cells(cube, **filters))['mean']
+
+
+def monthly_mean(cells):
+    """Average resale price per month over a set of cells."""
+    totals = cells.groupby('month')[['sum', 'count']].sum()
+    totals = totals[totals['count'] > 0]
+    return totals['sum'] / totals['count']
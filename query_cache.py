@@ -0,0 +1,180 @@
+import ast
+import itertools
+import threading
+from collections import OrderedDict
+
+from data_store import derived
+from query_engine import query_engine
+from query_executor import QueryRejected, format_result, query_executor, validate_query
+
+# Bounds of the process-wide result cache
+MAX_ENTRIES = 1024
+MAX_CHARS = 2_000_000
+
+# Precomputed at load time: value counts of these columns and price
+# aggregates grouped by these columns
+SUMMARY_COLUMNS = ['town', 'flat_type', 'flat_model', 'storey_range']
+SUMMARY_AGGREGATES = ['mean', 'median', 'min', 'max', 'count', 'sum']
+
+_versions = itertools.count(1)
+
+
+def data_version(df):
+    """A number identifying a frame, fixed for as long as the frame lives.
+
+    The data store builds one frame per set of source files, so this changes
+    whenever the data does.
+    """
+    return derived(df, 'data_version', lambda _: next(_versions))
+
+
+def normalize_query(query):
+    """Canonical form of a query: the dump of its validated AST.
+
+    Spacing, quote style and redundant parentheses do not change it. Raises
+    QueryRejected for queries the executor would refuse.
+    """
+    return ast.dump(validate_query(query))
+
+
+class QueryResultCache:
+    """LRU cache of formatted query results, bounded by entries and size."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_chars=MAX_CHARS):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._entries:
+                self._chars -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self._chars += len(value)
+            while self._entries and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+                _, evicted = self._entries.popitem(last=False)
+                self._chars -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chars = 0
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'chars': self._chars}
+
+
+result_cache = QueryResultCache()
+
+
+def build_summaries(df):
+    """Precomputes the results of the queries the LLM emits most often.
+
+    Returns a dict from normalized query to result, covering value_counts()
+    of SUMMARY_COLUMNS and groupby(column)['resale_price'].<aggregate>().
+    """
+    summaries = {}
+    for column in SUMMARY_COLUMNS:
+        summaries[normalize_query(f"df['{column}'].value_counts()")] = df[column].value_counts()
+        grouped = df.groupby(column, observed=True)['resale_price']
+        for aggregate in SUMMARY_AGGREGATES:
+            query = f"df.groupby('{column}')['resale_price'].{aggregate}()"
+            summaries[normalize_query(query)] = getattr(grouped, aggregate)()
+    return summaries
+
+
+def query_summaries(df):
+    """The summaries of a frame (cached, see data_store.derived)."""
+    return derived(df, 'query_summaries', build_summaries)
+
+
+def _year_filter(tree):
+    # Matches df[df['month'].dt.year == <int>] and returns the year
+    node = tree.body
+    if not (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == 'df'):
+        return None
+    test = node.slice
+    if not (isinstance(test, ast.Compare) and len(test.ops) == 1 and isinstance(test.ops[0], ast.Eq)):
+        return None
+    year = test.comparators[0]
+    if not (isinstance(year, ast.Constant) and isinstance(year.value, int)):
+        return None
+    expected = "df['month'].dt.year"
+    if ast.dump(test.left) != ast.dump(ast.parse(expected, mode='eval').body):
+        return None
+    return year.value
+
+
+def precomputed_result(df, query):
+    """Answers a query from the load-time summaries or the row indexes.
+
+    Returns the raw result, or None when the query needs a full evaluation.
+    """
+    tree = validate_query(query)
+    summaries = query_summaries(df)
+    key = ast.dump(tree)
+    if key in summaries:
+        return summaries[key]
+
+    year = _year_filter(tree)
+    if year is not None:
+        engine = query_engine(df)
+        return engine.frame(engine.rows(year=year))
+    return None
+
+
+def run_queries(df, queries):
+    """Runs [QUERY] expressions, reusing earlier results where possible.
+
+    Each query is answered, in order of preference, from the result cache
+    (keyed on the data version and the normalized AST), from the precomputed
+    summaries, or by the sandboxed executor. Returns one (ok, text) pair per
+    query like QueryExecutor.run_many.
+    """
+    version = data_version(df)
+    outcomes = [None] * len(queries)
+    keys = {}
+    to_run = []
+    for i, query in enumerate(queries):
+        try:
+            keys[i] = (version, normalize_query(query))
+        except QueryRejected:
+            # Let the executor report why the query is refused
+            to_run.append(i)
+            continue
+
+        cached = result_cache.get(keys[i])
+        if cached is not None:
+            outcomes[i] = (True, cached)
+            continue
+
+        result = precomputed_result(df, query)
+        if result is not None:
+            outcomes[i] = (True, format_result(result))
+            result_cache.set(keys[i], outcomes[i][1])
+        else:
+            to_run.append(i)
+
+    if to_run:
+        for i, outcome in zip(to_run, query_executor(df).run_many([queries[i] for i in to_run])):
+            outcomes[i] = outcome
+            if outcome[0] and i in keys:
+                result_cache.set(keys[i], outcome[1])
+    return outcomes
@@ -0,0 +1,178 @@
+import weakref
+
+import numpy as np
+import pandas as pd
+from data_store import derived
+
+# Categorical columns with a partition index (row positions grouped by value)
+PARTITION_COLUMNS = ['town', 'flat_type', 'flat_model']
+
+
+def _partition(series):
+    # Stable argsort of the category codes groups row positions by category,
+    # each group still in ascending row order
+    codes = series.cat.codes.to_numpy()
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(series.cat.categories) + 1))
+    return {
+        category: order[bounds[i]:bounds[i + 1]]
+        for i, category in enumerate(series.cat.categories)
+    }
+
+
+def _union(arrays):
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.sort(np.concatenate(arrays))
+
+
+def _year_ranges(year):
+    # An int or a list of years -> list of [start, end) month bounds, merging
+    # consecutive years so a range like 2013-2015 is a single interval
+    years = sorted(set(year if isinstance(year, (list, tuple, set, range)) else [year]))
+    ranges = []
+    for y in years:
+        if ranges and ranges[-1][1] == y:
+            ranges[-1][1] = y + 1
+        else:
+            ranges.append([y, y + 1])
+    return [(np.datetime64(f"{start}-01"), np.datetime64(f"{end}-01")) for start, end in ranges]
+
+
+class QueryEngine:
+    """Sorted and partitioned indexes over a resale frame.
+
+    Filters resolve to sorted arrays of row positions that are intersected
+    with each other, and the frame itself is only touched to take the final
+    rows. The data store keeps the frame sorted by month, which makes a month
+    or year filter a contiguous slice rather than a set of positions.
+    """
+
+    def __init__(self, df):
+        # A weak reference: the engine is cached for as long as the frame
+        # lives, so a strong one would keep both alive forever
+        self._df = weakref.ref(df)
+        self.size = len(df)
+
+        months = df['month'].to_numpy()
+        self._months_contiguous = bool(df['month'].is_monotonic_increasing)
+        if self._months_contiguous:
+            self._month_order = None
+            self._months_sorted = months
+        else:
+            self._month_order = np.argsort(months, kind='stable')
+            self._months_sorted = months[self._month_order]
+
+        areas = df['floor_area_sqm'].to_numpy()
+        self._areas = areas
+        self._area_order = np.argsort(areas, kind='stable')
+        self._areas_sorted = areas[self._area_order]
+
+        self._partitions = {column: _partition(df[column]) for column in PARTITION_COLUMNS}
+
+    def categories(self, column):
+        return list(self._partitions[column])
+
+    def _category_rows(self, column, value, exact, bounds=None):
+        # Clipping each category's rows to the month ranges (bounds) before
+        # merging keeps the work proportional to the rows in range rather
+        # than to the category's whole history
+        partition = self._partitions[column]
+        values = [v.lower() for v in ([value] if isinstance(value, str) else value)]
+        if exact:
+            matches = [v for v in values if v in partition]
+        else:
+            matches = [category for category in partition if any(v in category for v in values)]
+        if not matches:
+            return np.empty(0, dtype=np.intp)
+        if bounds is None:
+            return _union([partition[category] for category in matches])
+        return _union([self._clip(partition[category], bounds) for category in matches])
+
+    def _month_rows(self, start, end):
+        # Rows with start <= month < end
+        lo = np.searchsorted(self._months_sorted, start, side='left')
+        hi = np.searchsorted(self._months_sorted, end, side='left')
+        if self._months_contiguous:
+            return lo, hi
+        return np.sort(self._month_order[lo:hi])
+
+    def _area_rows(self, low, high):
+        lo = np.searchsorted(self._areas_sorted, low, side='left')
+        hi = np.searchsorted(self._areas_sorted, high, side='right')
+        return np.sort(self._area_order[lo:hi])
+
+    def rows(self, flat_type=None, year=None, town=None, flat_model=None,
+             area_range=None, month_range=None, exact=False):
+        """Returns the sorted row positions matching every filter given.
+
+        Text filters take a value or a list of values (any of which may
+        match) and match categories by substring, or exactly with
+        exact=True. year is an int or a list of ints, month_range a pair of
+        dates (end exclusive) and area_range an inclusive (low, high) pair.
+        Returns None when no filter is given, meaning every row.
+        """
+        intervals = []
+        if year:
+            intervals = _year_ranges(year)
+        if month_range:
+            start, end = (np.datetime64(pd.Timestamp(bound), 'M') for bound in month_range)
+            intervals.append((start, end))
+        month_sets = [self._month_rows(start, end) for start, end in intervals]
+        # With the frame sorted by month, the month filter is a set of row
+        # ranges that every other set is clipped to before intersecting
+        bounds = month_sets if intervals and self._months_contiguous else None
+
+        sets = []
+        for column, value in (('flat_type', flat_type), ('town', town), ('flat_model', flat_model)):
+            if value:
+                sets.append(self._category_rows(column, value, exact, bounds))
+        if intervals and bounds is None:
+            sets.append(_union(month_sets))
+        elif bounds is not None and not sets:
+            sets.append(_union([np.arange(lo, hi) for lo, hi in bounds]))
+
+        if not sets:
+            return self._area_rows(*area_range) if area_range else None
+        rows = self._intersect(sets)
+        if area_range:
+            # Checked on the matching rows only, rather than intersected with
+            # every row in the area range
+            areas = self._areas[rows]
+            rows = rows[(areas >= area_range[0]) & (areas <= area_range[1])]
+        return rows
+
+    @staticmethod
+    def _intersect(sets):
+        sets = sorted(sets, key=len)
+        result = sets[0]
+        for other in sets[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, other, assume_unique=True)
+        return result
+
+    @staticmethod
+    def _clip(rows, bounds):
+        parts = []
+        for lo, hi in bounds:
+            parts.append(rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)])
+        return _union(parts)
+
+    @property
+    def df(self):
+        return self._df()
+
+    def values(self, column, rows=None):
+        """Returns a column as a NumPy array, restricted to rows if given."""
+        values = self.df[column].to_numpy()
+        return values if rows is None else values[rows]
+
+    def frame(self, rows=None):
+        """Materializes the rows as a DataFrame (the shared frame when rows is None)."""
+        return self.df if rows is None else self.df.iloc[rows]
+
+
+def query_engine(df):
+    """Returns the engine for a frame (cached, see data_store.derived)."""
+    return derived(df, 'query_engine', QueryEngine)
@@ -0,0 +1,297 @@
+import ast
+import math
+import multiprocessing
+import os
+import resource
+import signal
+import tempfile
+import threading
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+from data_store import derived, map_frame, write_frame
+
+# Limits applied to every [QUERY] expression
+CPU_SECONDS = 2
+WALL_SECONDS = 5
+# Time allowed for a (re)started pool to map the frame before queries are timed
+STARTUP_SECONDS = 60
+MAX_RESULT_CHARS = 2000
+WORKER_MEMORY_BYTES = 2 * 1024 ** 3
+WORKERS = min(4, os.cpu_count() or 1)
+
+# Syntax allowed in a query: a single expression over df made of indexing,
+# attribute access, method calls, comparisons and arithmetic. No lambdas,
+# comprehensions, assignments or names other than df and a few builtins.
+ALLOWED_NODES = (
+    ast.Expression, ast.Name, ast.Load, ast.Constant, ast.Attribute, ast.Subscript,
+    ast.Slice, ast.Call, ast.keyword, ast.Compare, ast.BoolOp, ast.BinOp, ast.UnaryOp,
+    ast.List, ast.Tuple, ast.Dict,
+    ast.And, ast.Or, ast.Not, ast.Invert, ast.USub, ast.UAdd,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+    ast.BitAnd, ast.BitOr, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+)
+
+SAFE_BUILTINS = {'len': len, 'round': round, 'abs': abs, 'min': min, 'max': max,
+                 'sum': sum, 'int': int, 'float': float, 'str': str}
+
+# pandas attributes and methods a query may use. Anything that runs arbitrary
+# Python (apply, map, pipe, eval, query), joins frames (merge, join) or
+# renders whole frames (to_string, to_csv) is left out.
+ALLOWED_ATTRIBUTES = {
+    # selection
+    'loc', 'iloc', 'head', 'tail', 'nlargest', 'nsmallest', 'sort_values', 'sort_index',
+    'drop_duplicates', 'dropna', 'isin', 'between', 'isna', 'notna', 'filter', 'columns',
+    'index', 'values', 'shape', 'size', 'empty', 'dtypes', 'reset_index', 'set_index',
+    'rename', 'astype', 'copy',
+    # aggregation
+    'mean', 'median', 'sum', 'count', 'min', 'max', 'std', 'var', 'quantile', 'describe',
+    'nunique', 'unique', 'value_counts', 'idxmax', 'idxmin', 'mode', 'agg', 'aggregate',
+    'groupby', 'first', 'last', 'cumsum', 'pct_change', 'diff', 'round', 'abs',
+    'corr', 'resample', 'rolling', 'pivot_table', 'unstack', 'stack', 'to_dict', 'tolist',
+    'item', 'all', 'any',
+    # datetime and string accessors
+    'dt', 'year', 'month', 'quarter', 'to_period', 'strftime', 'date',
+    'str', 'contains', 'lower', 'upper', 'startswith', 'endswith', 'strip',
+    'cat', 'categories',
+}
+
+# Functions a query may name by string. agg, aggregate and pivot_table look
+# any other name up with getattr, which would reach methods left out above
+# (to_csv, to_pickle, eval, apply, ...)
+SAFE_REDUCTIONS = {'mean', 'median', 'sum', 'count', 'min', 'max', 'std', 'var',
+                   'nunique', 'first', 'last'}
+AGGREGATING_METHODS = {'agg', 'aggregate'}
+
+
+class QueryRejected(ValueError):
+    """Raised for a [QUERY] expression outside the allowed subset."""
+
+
+class QueryTimeout(Exception):
+    """Raised in a worker when a query exceeds its CPU time budget."""
+
+
+def _check_functions(node):
+    # node says which function(s) to apply: a name, or a list, tuple or dict
+    # (values only) of names. Anything computed could spell any method name.
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        if node.value not in SAFE_REDUCTIONS:
+            raise QueryRejected(f"aggregation '{node.value}' is not allowed")
+    elif isinstance(node, (ast.List, ast.Tuple)):
+        for element in node.elts:
+            _check_functions(element)
+    elif isinstance(node, ast.Dict):
+        for value in node.values:
+            _check_functions(value)
+    elif not isinstance(node, ast.Name):
+        raise QueryRejected("aggregations must be named by a string or a list of strings")
+
+
+def _check_aggregation(call):
+    method = call.func.attr
+    if method in AGGREGATING_METHODS:
+        for arg in call.args:
+            _check_functions(arg)
+        for keyword in call.keywords:
+            value = keyword.value
+            if keyword.arg == 'func':
+                _check_functions(value)
+            elif isinstance(value, ast.Tuple) and len(value.elts) == 2:
+                # Named aggregation: name=(column, function)
+                _check_functions(value.elts[1])
+            elif isinstance(value, (ast.Constant, ast.List, ast.Tuple, ast.Dict)) and any(
+                    isinstance(n, ast.Constant) and isinstance(n.value, str) for n in ast.walk(value)):
+                _check_functions(value)
+    elif method == 'pivot_table':
+        # pivot_table(values, index, columns, aggfunc, ...)
+        if len(call.args) > 3:
+            _check_functions(call.args[3])
+        for keyword in call.keywords:
+            if keyword.arg == 'aggfunc':
+                _check_functions(keyword.value)
+
+
+def validate_query(query):
+    """Parses a query and checks it against the whitelist.
+
+    Returns the parsed expression, or raises QueryRejected.
+    """
+    try:
+        tree = ast.parse(query.strip(), mode='eval')
+    except SyntaxError as e:
+        raise QueryRejected(f"invalid syntax: {e.msg}")
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise QueryRejected(f"{type(node).__name__} is not allowed")
+        if isinstance(node, ast.Name) and node.id != 'df' and node.id not in SAFE_BUILTINS:
+            raise QueryRejected(f"name '{node.id}' is not allowed")
+        if isinstance(node, ast.Attribute) and node.attr not in ALLOWED_ATTRIBUTES:
+            raise QueryRejected(f"'.{node.attr}' is not allowed")
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'df':
+            raise QueryRejected("df is not callable")
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            _check_aggregation(node)
+    return tree
+
+
+def format_result(result, max_chars=MAX_RESULT_CHARS):
+    """Formats a query result for the response text, capped at max_chars."""
+    if isinstance(result, pd.DataFrame):
+        result_str = f"\n{result.head(1).to_string()}\n...(showing first row of dataframe)"
+    elif isinstance(result, pd.Series):
+        result_str = f"\n{result.head(1).to_string()}\n...(showing first row of series)"
+    elif isinstance(result, np.ndarray):
+        result_str = np.array2string(result, threshold=50)
+    else:
+        result_str = str(result)
+    if len(result_str) > max_chars:
+        result_str = result_str[:max_chars] + "...(truncated)"
+    return result_str
+
+
+# Worker process state: the frame, mapped once per worker
+_frame = None
+
+
+def _raise_cpu_timeout(signum, frame):
+    raise QueryTimeout("query exceeded its CPU time limit")
+
+
+def _init_worker(path, memory_bytes):
+    global _frame
+    # Ignore Ctrl+C in workers; the parent shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGXCPU, _raise_cpu_timeout)
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard == resource.RLIM_INFINITY or memory_bytes < hard:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, hard))
+    _frame, _ = map_frame(path, split_blocks=True)
+
+
+def _ping(_):
+    # Keeps a worker busy briefly, so one ping lands on each worker
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def _run_query(query, cpu_seconds, max_chars):
+    # Runs in a worker: returns (True, formatted result) or (False, error)
+    try:
+        tree = validate_query(query)
+        # SIGXCPU fires once the process has used cpu_seconds more CPU time
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        soft = math.ceil(used.ru_utime + used.ru_stime) + cpu_seconds
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        try:
+            code = compile(tree, '<query>', 'eval')
+            result = eval(code, {'__builtins__': SAFE_BUILTINS, 'df': _frame})
+            return True, format_result(result, max_chars)
+        finally:
+            resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+    except MemoryError:
+        return False, "query exceeded the memory limit"
+    except Exception as e:
+        return False, str(e)
+
+
+def _shutdown(pool, path):
+    pool.terminate()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class QueryExecutor:
+    """Runs LLM-generated [QUERY] expressions in a pool of worker processes.
+
+    Each worker memory-maps a read-only Arrow copy of the frame, runs one
+    whitelisted expression at a time under a CPU time budget and an address
+    space limit, and returns only the formatted (size-capped) result. A query
+    that overruns the wall time limit gets the pool restarted, so a runaway
+    expression can no longer stall the Streamlit server.
+    """
+
+    def __init__(self, df, workers=WORKERS, cpu_seconds=CPU_SECONDS, wall_seconds=WALL_SECONDS,
+                 max_chars=MAX_RESULT_CHARS, memory_bytes=WORKER_MEMORY_BYTES):
+        self.workers = workers
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.max_chars = max_chars
+        self.memory_bytes = memory_bytes
+
+        fd, self._path = tempfile.mkstemp(prefix="hdb_query_frame_", suffix=".arrow")
+        os.close(fd)
+        write_frame(df, self._path)
+        # Spawned rather than forked: the Streamlit server is multi-threaded
+        self._context = multiprocessing.get_context('spawn')
+        # Sessions share the executor: guards submitting against restarting
+        self._lock = threading.Lock()
+        self._start_pool()
+
+    def _start_pool(self):
+        self._pool = self._context.Pool(
+            self.workers, initializer=_init_worker, initargs=(self._path, self.memory_bytes)
+        )
+        self._finalizer = weakref.finalize(self, _shutdown, self._pool, self._path)
+        # Workers only pick up a task once their initializer has run
+        self._ready = self._pool.map_async(_ping, range(self.workers), chunksize=1)
+
+    def _restart_pool(self):
+        self._finalizer.detach()
+        self._pool.terminate()
+        self._start_pool()
+
+    def run_many(self, queries):
+        """Runs independent queries in parallel.
+
+        Returns one (ok, text) pair per query, where text is the formatted
+        result or the reason the query failed.
+        """
+        outcomes = [None] * len(queries)
+        # Worker startup (importing pandas, mapping the frame) does not count
+        # against the wall time limit of the queries
+        self._ready.wait(STARTUP_SECONDS)
+
+        pending = {}
+        with self._lock:
+            pool = self._pool
+            for i, query in enumerate(queries):
+                try:
+                    validate_query(query)
+                except QueryRejected as e:
+                    outcomes[i] = (False, f"query not allowed: {e}")
+                    continue
+                pending[i] = pool.apply_async(_run_query, (query, self.cpu_seconds, self.max_chars))
+
+        # The queries run side by side, so they share one deadline
+        deadline = time.monotonic() + self.wall_seconds
+        timed_out = False
+        for i, result in pending.items():
+            try:
+                outcomes[i] = result.get(timeout=max(0, deadline - time.monotonic()))
+            except multiprocessing.TimeoutError:
+                timed_out = True
+                outcomes[i] = (False, f"query exceeded {self.wall_seconds}s")
+        if timed_out:
+            with self._lock:
+                # Another session may have restarted the pool already
+                if self._pool is pool:
+                    self._restart_pool()
+        return outcomes
+
+    def run(self, query):
+        return self.run_many([query])[0]
+
+    def close(self):
+        self._finalizer()
+
+
+def query_executor(df):
+    """Returns the executor for a frame (cached, see data_store.derived)."""
+    return derived(df, 'query_executor', QueryExecutor)
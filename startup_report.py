@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+REPEAT = 5
+
+# The page modules app.py used to import before showing anything
+PAGE_MODULES = ["affordability_calculator", "about_us", "general_query", "methodology"]
+
+# Placeholder secrets: neither page checks a password or calls the LLM
+SECRETS = {"STREAMLIT_PASSWORD": "unused", "OPENAI_API_KEY": "unused"}
+
+
+def first_paint(page, eager):
+    """Seconds to the first complete run of app.py for page, in this (fresh) process.
+
+    page is 'login' (not yet authenticated) or 'main'. eager imports every
+    page module first, like app.py did before page modules were loaded lazily.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    with open(APP_PATH) as f:
+        script = f.read()
+    if eager:
+        script = "".join(f"import {module}\n" for module in PAGE_MODULES) + script
+    app = AppTest.from_string(script, default_timeout=120)
+    for key, value in SECRETS.items():
+        app.secrets[key] = value
+    if page == 'main':
+        app.session_state["authenticated"] = True
+
+    start = time.perf_counter()
+    app.run()
+    elapsed = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    return elapsed
+
+
+def measure(page, eager, repeat=REPEAT):
+    # Every run gets a fresh interpreter, so imports are cold as on a new server
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", page] + (["--eager"] if eager else []),
+            cwd=os.path.dirname(APP_PATH), capture_output=True, text=True, check=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings) * 1000
+
+
+def report(repeat=REPEAT):
+    """Median first-paint times (ms) of the login and Main pages, eager vs lazy imports."""
+    rows = {}
+    for page in ('login', 'main'):
+        eager = measure(page, True, repeat)
+        lazy = measure(page, False, repeat)
+        rows[page] = {'eager_ms': round(eager, 1), 'lazy_ms': round(lazy, 1),
+                      'saved_ms': round(eager - lazy, 1)}
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="First-paint time of the login and Main pages.")
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    parser.add_argument('--child', choices=['login', 'main'], help=argparse.SUPPRESS)
+    parser.add_argument('--eager', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(first_paint(args.child, args.eager))
+        sys.exit(0)
+
+    rows = report(args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{'page':<8}{'eager imports':>16}{'lazy imports':>16}{'saved':>12}")
+        for page, row in rows.items():
+            print(f"{page:<8}{row['eager_ms']:>13.1f} ms{row['lazy_ms']:>13.1f} ms{row['saved_ms']:>9.1f} ms")
+        print(f"Median of {args.repeat} cold starts each, timed from the first script run "
+              "(the Streamlit server itself is already up).")
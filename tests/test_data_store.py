@@ -0,0 +1,92 @@
+import gc
+import glob
+import os
+import weakref
+
+import data_store
+import pandas as pd
+import pytest
+from data_store import DATA_DIR, derived, ingest, source_signature
+from price_cube import price_cube
+from query_engine import query_engine
+from query_executor import QueryExecutor
+
+ROWS_PER_RELEASE = 300
+
+
+@pytest.fixture(scope='module')
+def releases():
+    # Small slices of the bundled 2012-2014 and 2015-2016 releases
+    files = sorted(glob.glob(os.path.join(DATA_DIR, "*.csv")))
+    return {os.path.basename(file): pd.read_csv(file, nrows=ROWS_PER_RELEASE) for file in files}
+
+
+def _write(data_dir, name, frame, mtime):
+    path = os.path.join(data_dir, name)
+    frame.to_csv(path, index=False)
+    os.utime(path, (mtime, mtime))
+
+
+def _monthly_counts(df):
+    return df.groupby('month').size()
+
+
+def test_incremental_ingest_matches_full_rebuild(releases, tmp_path):
+    (older_name, older), (newer_name, newer) = sorted(releases.items(), key=lambda item: item[1]['month'].min())
+    incremental = tmp_path / "incremental"
+    full = tmp_path / "full"
+    incremental.mkdir()
+    full.mkdir()
+
+    # The store holds the older release, then two overlapping copies of a
+    # newer release arrive together
+    _write(incremental, older_name, older, 1_000)
+    ingest(source_signature(incremental), incremental)
+    for data_dir in [incremental, full]:
+        _write(data_dir, "copy a.csv", newer, 2_000)
+        _write(data_dir, "copy b.csv", newer, 3_000)
+    _write(full, older_name, older, 1_000)
+
+    incremental_df, parsed = ingest(source_signature(incremental), incremental)
+    assert sorted(parsed) == ["copy a.csv", "copy b.csv"]
+    full_df, _ = ingest(source_signature(full), full)
+
+    assert len(incremental_df) == len(full_df) == len(older) + len(newer)
+    pd.testing.assert_series_equal(_monthly_counts(incremental_df), _monthly_counts(full_df))
+    # The later copy wins its months
+    newer_rows = incremental_df[incremental_df['month'] >= pd.Timestamp(newer['month'].min())]
+    assert set(newer_rows['source_file'].astype(str)) == {"copy b.csv"}
+
+
+def test_new_release_replaces_overlapping_months_of_the_store(releases, tmp_path):
+    _, newer = max(releases.items(), key=lambda item: item[1]['month'].min())
+    _write(tmp_path, "first.csv", newer, 1_000)
+    ingest(source_signature(tmp_path), tmp_path)
+    _write(tmp_path, "second.csv", newer, 2_000)
+
+    df, parsed = ingest(source_signature(tmp_path), tmp_path)
+    assert parsed == ["second.csv"]
+    assert len(df) == len(newer)
+    assert set(df['source_file'].astype(str)) == {"second.csv"}
+
+
+def test_derived_structures_die_with_their_frame(releases, tmp_path):
+    _, newer = max(releases.items(), key=lambda item: item[1]['month'].min())
+    _write(tmp_path, "release.csv", newer, 1_000)
+    df, _ = ingest(source_signature(tmp_path), tmp_path)
+
+    engine = query_engine(df)
+    price_cube(df)
+    executor = derived(df, 'query_executor', lambda frame: QueryExecutor(frame, workers=1))
+    assert query_engine(df) is engine
+    assert executor.run("len(df)") == (True, str(len(newer)))
+
+    frame_id, frame_ref = id(df), weakref.ref(df)
+    del df
+    gc.collect()
+    # The engine's reference to its frame does not keep it alive, and the
+    # executor's worker pool and frame file go with it
+    assert frame_ref() is None
+    assert not [key for key in data_store._derived if key[0] == frame_id]
+    assert not executor._finalizer.alive
+    assert not os.path.exists(executor._path)
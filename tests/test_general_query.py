@@ -0,0 +1,64 @@
+import general_query
+import pytest
+from general_query import process_ai_response_with_dataframe_queries, stream_ai_response_with_dataframe_queries
+
+RESPONSE = "abc [QUERY]df['resale_price'].mean()[/QUERY] and [QUERY]len(df)[/QUERY] tail ["
+
+
+@pytest.fixture(autouse=True)
+def fake_queries(monkeypatch):
+    # Queries answer with their own text, so no frame or executor is needed
+    calls = []
+
+    def run_queries(data, queries):
+        calls.append(list(queries))
+        return [(True, f"<{query}>") for query in queries]
+
+    monkeypatch.setattr(general_query, 'run_queries', run_queries)
+    return calls
+
+
+def _stream(chunks):
+    return list(stream_ai_response_with_dataframe_queries(chunks, None))
+
+
+@pytest.mark.parametrize('chunks', [
+    ["abc [QUE", "RY]df['resale_price'].mean()[/QU", "ERY] and [QUERY]len(df)[/QUERY] tail ["],
+    ["abc [", "QUERY]df['resale_price'].mean()[", "/QUERY]", " and [QUERY]len(df)[/QUERY", "]", " tail ["],
+    list(RESPONSE),
+    [RESPONSE],
+])
+def test_tags_split_across_chunks(chunks):
+    assert ''.join(chunks) == RESPONSE
+    parts = _stream(chunks)
+    assert ''.join(parts) == process_ai_response_with_dataframe_queries(RESPONSE, None)
+    assert ''.join(parts) == "abc <df['resale_price'].mean()> and <len(df)> tail ["
+    # No piece of a tag is ever shown
+    assert not any('[Q' in part or '[/' in part for part in parts)
+
+
+def test_every_split_point(fake_queries):
+    expected = process_ai_response_with_dataframe_queries(RESPONSE, None)
+    for i in range(len(RESPONSE) + 1):
+        for j in range(i, len(RESPONSE) + 1):
+            assert ''.join(_stream([RESPONSE[:i], RESPONSE[i:j], RESPONSE[j:]])) == expected
+
+
+def test_text_is_yielded_before_the_query_closes(fake_queries):
+    seen = []
+
+    def chunks():
+        for chunk in ["abc [QUE", "RY]len(df)", "[/QUERY] tail"]:
+            yield chunk
+            seen.append(chunk)
+
+    stream = stream_ai_response_with_dataframe_queries(chunks(), None)
+    assert next(stream) == "abc "
+    assert seen == []
+    assert next(stream) == "<len(df)>"
+    assert fake_queries == [["len(df)"]]
+    assert list(stream) == [" tail"]
+
+
+def test_unterminated_query_is_shown_as_is():
+    assert ''.join(_stream(["abc [QUERY]len(", "df)"])) == "abc [QUERY]len(df)"
@@ -0,0 +1,160 @@
+import pandas as pd
+import pytest
+from intent_parser import answer_query, parse_query
+
+VOCABULARY = {
+    'town': ['bedok', 'tampines', 'woodlands'],
+    'flat_type': ['3 room', '4 room', '5 room', 'executive'],
+    'flat_model': ['improved', 'model a', 'new generation'],
+    'years': (2012, 2024),
+}
+
+
+@pytest.mark.parametrize('question', [
+    "How many transactions were there in 2014?",
+    "how many 4 room flats were sold in bedok",
+    "number of resales in tampines in 2015",
+    "how many flats were resold in woodlands in 2019",
+    "What is the volume of sales for executive flats?",
+])
+def test_counts_of_sales(question):
+    parsed = parse_query(question, VOCABULARY)
+    assert (parsed['intent'], parsed['stat']) == ('count', 'count')
+
+
+@pytest.mark.parametrize('question', [
+    "how many rooms does an executive flat have",
+    "how many bedrooms are in a 4 room flat in bedok",
+    "what is the number of floors of blocks in tampines",
+    "how many 4 room flats cost more than 500k",
+    "how many flats sold for over a million in 2020",
+    "how many flats were resold in woodlands last year",
+    "number of sales in bedok this year",
+    "how many resales were there in the past 3 years",
+])
+def test_other_counts_go_to_the_llm(question):
+    assert parse_query(question, VOCABULARY)['intent'] is None
+
+
+@pytest.fixture
+def frame():
+    # Bedok has three sales, tampines two and woodlands one, all in 2015;
+    # the categories include a town with no sales at all
+    towns = ['bedok', 'bedok', 'bedok', 'tampines', 'tampines', 'woodlands']
+    return pd.DataFrame({
+        'month': pd.to_datetime(['2015-01'] * 3 + ['2015-02'] * 3),
+        'town': pd.Categorical(towns, categories=['bedok', 'tampines', 'woodlands', 'yishun']),
+        'flat_type': pd.Categorical(['4 room'] * 6),
+        'flat_model': pd.Categorical(['improved'] * 6),
+        'floor_area_sqm': [90.0, 92.0, 95.0, 91.0, 93.0, 96.0],
+        'resale_price': [400000, 410000, 420000, 500000, 520000, 350000],
+    })
+
+
+@pytest.mark.parametrize('question, stat, rank', [
+    ("Which town has the most transactions?", 'count', 'max'),
+    ("Which town has the fewest transactions?", 'count', 'min'),
+    ("Which town had the least transactions in 2015?", 'count', 'min'),
+    ("Which estate has the lowest number of resales?", 'count', 'min'),
+    ("Which town is the most expensive for 3 room flats?", 'mean', 'max'),
+    ("Which town has the cheapest 5 room flats?", 'mean', 'min'),
+    ("What area has the lowest median price?", 'median', 'min'),
+])
+def test_town_rankings(question, stat, rank):
+    parsed = parse_query(question, VOCABULARY)
+    assert (parsed['intent'], parsed['stat'], parsed['rank']) == ('rank_towns', stat, rank)
+
+
+@pytest.mark.parametrize('question', [
+    "Which town had sales in 2015?",
+    "Which area had the most sales and the lowest prices?",
+])
+def test_rankings_without_a_clear_direction_go_to_the_llm(question):
+    assert parse_query(question, VOCABULARY)['intent'] is None
+
+
+def test_town_rankings_are_answered_in_the_direction_asked(frame):
+    most = answer_query(frame, parse_query("Which town has the most transactions?", VOCABULARY))
+    assert most.startswith("bedok has the most resale transactions (3)")
+    fewest = answer_query(frame, parse_query("Which town has the fewest transactions?", VOCABULARY))
+    assert fewest.startswith("woodlands has the fewest resale transactions (1)")
+    cheapest = answer_query(frame, parse_query("Which town has the cheapest 4 room flats?", VOCABULARY))
+    assert cheapest.startswith("woodlands has the lowest average resale price (SGD 350,000.00)")
+
+
+@pytest.mark.parametrize('question, years', [
+    ("average price of 4 room flats in 2015", [2015]),
+    ("average price of 4 room flats in 2013 and 2015", [2013, 2015]),
+    ("average price of 4 room flats in 2013, 2015 and 2017", [2013, 2015, 2017]),
+    ("average price of 4 room flats between 2013 and 2015", [2013, 2014, 2015]),
+    ("median price of 5 room flats in tampines from 2013 to 2015", [2013, 2014, 2015]),
+    ("average price of 4 room flats in 2015-2013", [2013, 2014, 2015]),
+    ("average price of 4 room flats since 2022", [2022, 2023, 2024]),
+    ("average price of 4 room flats after 2022", [2023, 2024]),
+    ("average price of 4 room flats before 2014", [2012, 2013]),
+])
+def test_years(question, years):
+    assert parse_query(question, VOCABULARY)['years'] == years
+
+
+@pytest.mark.parametrize('question, stat, towns, flat_types', [
+    ("What is the average resale price for 4-room flats in bedok in 2015?", 'mean', ['bedok'], ['4 room']),
+    ("median price of 5 room flats in tampines", 'median', ['tampines'], ['5 room']),
+    ("What is the cheapest executive flat in woodlands?", 'min', ['woodlands'], ['executive']),
+    ("highest price paid for a 3rm flat", 'max', [], ['3 room']),
+    ("how much does a 5 room flat in tampines cost", 'mean', ['tampines'], ['5 room']),
+])
+def test_price_statistics(question, stat, towns, flat_types):
+    parsed = parse_query(question, VOCABULARY)
+    assert (parsed['intent'], parsed['stat']) == ('price_stat', stat)
+    assert (parsed['towns'], parsed['flat_types']) == (towns, flat_types)
+
+
+@pytest.mark.parametrize('question', [
+    "average price of flats above 100 sqm in bedok",
+    "price per sqm in bedok",
+    "which street has the highest prices",
+    "average price of high floor 4 room flats in tampines",
+    "price of 4 room flats in bedok with 60 years of lease left",
+    "Why are prices in woodlands so high compared to bedok?",
+    "Should I buy a 4 room flat in bedok or wait for prices to drop?",
+    "Will prices of 5 room flats in tampines go up?",
+    "Is a 4 room flat in bedok cheaper than one in tampines?",
+    "average price of 4 room flats in bedok vs tampines",
+])
+def test_conditions_the_parser_cannot_apply_go_to_the_llm(question):
+    assert parse_query(question, VOCABULARY)['intent'] is None
+
+
+@pytest.mark.parametrize('question, towns, flat_types', [
+    ("Price trend for 4 room flats in bedok and tampines", ['bedok', 'tampines'], ['4 room']),
+    ("how have prices of 5 room flats in woodlands changed over the years?", ['woodlands'], ['5 room']),
+    ("executive flat prices over time", [], ['executive']),
+    ("price trend in bedok vs tampines", ['bedok', 'tampines'], []),
+])
+def test_trends(question, towns, flat_types):
+    parsed = parse_query(question, VOCABULARY)
+    assert parsed['intent'] == 'trend'
+    assert (sorted(parsed['towns']), parsed['flat_types']) == (towns, flat_types)
+
+
+def test_sales_over_time_are_not_a_price_trend():
+    assert parse_query("how many sales over the years", VOCABULARY)['intent'] != 'trend'
+
+
+@pytest.mark.parametrize('question, towns', [
+    ("average price in tampinez", ['tampines']),
+    ("average price in woodland", ['woodlands']),
+    ("average price in bedok and tampines", ['bedok', 'tampines']),
+    ("average price in bedok north", ['bedok']),
+])
+def test_towns(question, towns):
+    assert sorted(parse_query(question, VOCABULARY)['towns']) == towns
+
+
+def test_flat_models_and_aliases():
+    vocabulary = {**VOCABULARY, 'town': VOCABULARY['town'] + ['ang mo kio']}
+    parsed = parse_query("average price of new generation 3-room flats in amk", vocabulary)
+    assert parsed['intent'] == 'price_stat'
+    assert (parsed['towns'], parsed['flat_types'], parsed['flat_models']) == (
+        ['ang mo kio'], ['3 room'], ['new generation'])
@@ -0,0 +1,107 @@
+import llm_cache
+import pytest
+from llm_cache import LLMCache, cache_key, cached_stream_chat_completion
+
+MODEL = "gpt-test"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, 'time', clock)
+    return clock
+
+
+class StubLLM:
+    """Stands in for the API: answers with the prompt and counts the calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, model, messages):
+        self.calls += 1
+        return f"answer to {messages[-1]['content']}"
+
+    def stream(self, model, messages):
+        self.calls += 1
+        yield "answer to "
+        yield messages[-1]['content']
+
+
+def _messages(text):
+    return [{'role': 'user', 'content': text}]
+
+
+def test_hits_misses_and_normalized_prompts(clock):
+    cache = LLMCache(":memory:", ttl=60, max_entries=10)
+    llm = StubLLM()
+    assert cache.get_or_create(MODEL, _messages("Price of 4 room?"), llm.create) == "answer to Price of 4 room?"
+    assert cache.get_or_create(MODEL, _messages("  price of 4 ROOM? "), llm.create) == "answer to Price of 4 room?"
+    cache.get_or_create("other-model", _messages("Price of 4 room?"), llm.create)
+    assert llm.calls == 2
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3, 'entries': 2}
+
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'entries': 0}
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = LLMCache(":memory:", ttl=60, max_entries=10)
+    llm = StubLLM()
+    cache.get_or_create(MODEL, _messages("a"), llm.create)
+    clock.now += 60
+    cache.get_or_create(MODEL, _messages("a"), llm.create)
+    assert llm.calls == 1
+
+    clock.now += 1
+    cache.get_or_create(MODEL, _messages("a"), llm.create)
+    assert llm.calls == 2
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_expired_entries_are_dropped_on_write(clock):
+    cache = LLMCache(":memory:", ttl=60, max_entries=10)
+    cache.set("old", MODEL, "old answer")
+    clock.now += 61
+    cache.set("new", MODEL, "new answer")
+    assert cache.stats()['entries'] == 1
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = LLMCache(":memory:", ttl=60, max_entries=2)
+    llm = StubLLM()
+    for text in ["a", "b"]:
+        cache.get_or_create(MODEL, _messages(text), llm.create)
+        clock.now += 1
+    # Using "a" makes "b" the least recently used
+    cache.get_or_create(MODEL, _messages("a"), llm.create)
+    clock.now += 1
+    cache.get_or_create(MODEL, _messages("c"), llm.create)
+
+    assert cache.stats()['entries'] == 2
+    assert cache.get(cache_key(MODEL, _messages("a"))) == "answer to a"
+    assert cache.get(cache_key(MODEL, _messages("b"))) is None
+    assert cache.get(cache_key(MODEL, _messages("c"))) == "answer to c"
+
+
+def test_streams_are_cached_only_once_complete(clock, monkeypatch):
+    cache = LLMCache(":memory:", ttl=60, max_entries=10)
+    monkeypatch.setattr(llm_cache, 'llm_cache', lambda: cache)
+    llm = StubLLM()
+
+    interrupted = cached_stream_chat_completion(MODEL, _messages("a"), stream=llm.stream)
+    assert next(interrupted) == "answer to "
+    interrupted.close()
+    assert cache.stats()['entries'] == 0
+
+    assert list(cached_stream_chat_completion(MODEL, _messages("a"), stream=llm.stream)) == ["answer to ", "a"]
+    assert list(cached_stream_chat_completion(MODEL, _messages("a"), stream=llm.stream)) == ["answer to a"]
+    assert llm.calls == 2
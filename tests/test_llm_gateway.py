@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+from llm_gateway import LLMGateway, LLMUnavailable
+
+MODEL = "gpt-test"
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    """Chat completions endpoint answering "echo: <last message>".
+
+    The server's settings decide how many requests fail first and with what
+    status, and how long an answer takes; it counts requests and the most
+    it served at once.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+            fail = server.failures > 0
+            server.failures -= fail
+        try:
+            if fail:
+                self._send_json(server.status, {'error': {'message': "try again", 'type': "server_error"}})
+                return
+            time.sleep(server.delay)
+            text = "echo: " + body['messages'][-1]['content']
+            if body.get('stream'):
+                self._send_stream([text[:6], text[6:]])
+            else:
+                self._send_json(200, {'choices': [{'message': {'role': 'assistant', 'content': text}}],
+                                      'usage': {'prompt_tokens': 3, 'completion_tokens': 2}})
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _send_json(self, status, payload):
+        out = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def _send_stream(self, deltas):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        events = [{'choices': [{'delta': {'content': delta}, 'index': 0}]} for delta in deltas]
+        for event in [json.dumps(event) for event in events] + ["[DONE]"]:
+            data = f"data: {event}\n\n".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAI)
+    server.lock = threading.Lock()
+    server.requests = server.active = server.peak = server.failures = 0
+    server.status = 429
+    server.delay = 0.0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(openai, 'api_base', f"http://127.0.0.1:{server.server_port}/v1")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_gateway():
+    gateways = []
+
+    def make(**options):
+        options = {'api_key': "test", 'backoff': 0.01, 'max_backoff': 0.05, **options}
+        gateways.append(LLMGateway(**options))
+        return gateways[-1]
+
+    yield make
+    for gateway in gateways:
+        gateway.close()
+
+
+def _messages(text):
+    return [{'role': 'user', 'content': text}]
+
+
+def test_complete_and_stream(server, make_gateway):
+    gateway = make_gateway()
+    assert gateway.complete(MODEL, _messages("hi")) == "echo: hi"
+    assert list(gateway.stream(MODEL, _messages("there"))) == ["echo: ", "there"]
+    stats = gateway.stats()
+    assert stats['calls'] == 2 and stats['errors'] == 0
+    assert stats['prompt_tokens'] == 3
+
+
+def test_identical_prompts_in_flight_are_coalesced(server, make_gateway):
+    server.delay = 0.5
+    gateway = make_gateway()
+    with ThreadPoolExecutor(5) as pool:
+        answers = list(pool.map(lambda _: gateway.complete(MODEL, _messages("same")), range(5)))
+        streams = list(pool.map(lambda _: ''.join(gateway.stream(MODEL, _messages("same"))), range(5)))
+    assert answers == streams == ["echo: same"] * 5
+    assert server.requests == 2
+    assert gateway.stats()['coalesced'] == 8
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_rate_limits_and_server_errors_are_retried(server, make_gateway, status):
+    server.failures, server.status = 2, status
+    gateway = make_gateway(max_retries=2)
+    assert gateway.complete(MODEL, _messages("hi")) == "echo: hi"
+    assert server.requests == 3
+    assert gateway.stats()['retries'] == 2
+
+
+def test_retries_give_up_with_a_message(server, make_gateway):
+    server.failures, server.status = 10, 503
+    gateway = make_gateway(max_retries=2)
+    with pytest.raises(LLMUnavailable):
+        gateway.complete(MODEL, _messages("hi"))
+    with pytest.raises(LLMUnavailable):
+        list(gateway.stream(MODEL, _messages("there")))
+    assert server.requests == 6
+    assert gateway.stats()['errors'] == 2
+
+
+def test_client_errors_are_not_retried(server, make_gateway):
+    server.failures, server.status = 1, 400
+    gateway = make_gateway()
+    with pytest.raises(openai.error.InvalidRequestError):
+        gateway.complete(MODEL, _messages("hi"))
+    assert server.requests == 1
+
+
+def test_slow_completions_time_out(server, make_gateway):
+    server.delay = 1.0
+    gateway = make_gateway(timeout=0.2)
+    started = time.monotonic()
+    with pytest.raises(LLMUnavailable, match="did not respond"):
+        gateway.complete(MODEL, _messages("hi"))
+    with pytest.raises(LLMUnavailable, match="did not respond"):
+        list(gateway.stream(MODEL, _messages("there")))
+    assert time.monotonic() - started < 1.5
+    assert gateway.stats()['timeouts'] == 2
+
+
+def test_concurrent_requests_are_capped(server, make_gateway):
+    server.delay = 0.2
+    gateway = make_gateway(max_concurrency=2)
+    with ThreadPoolExecutor(8) as pool:
+        answers = list(pool.map(lambda i: gateway.complete(MODEL, _messages(str(i))), range(8)))
+    assert answers == [f"echo: {i}" for i in range(8)]
+    assert server.requests == 8
+    assert server.peak == 2
+
+
+def test_requests_waiting_too_long_for_a_slot_are_refused(server, make_gateway):
+    server.delay = 1.0
+    gateway = make_gateway(max_concurrency=1, queue_timeout=0.2)
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(gateway.complete, MODEL, _messages("first"))
+        time.sleep(0.1)
+        second = pool.submit(gateway.complete, MODEL, _messages("second"))
+        with pytest.raises(LLMUnavailable, match="busy"):
+            second.result()
+        assert first.result() == "echo: first"
+    assert gateway.stats()['refused'] == 1
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from loan import annuity_factor, loan_grid, max_loan, monthly_instalment, repayment_cap, sensitivity_grid
+
+# 2.6% a year over 25 years: a 300,000 loan repays 1,361.01 a month, the
+# figure any mortgage calculator gives, so 1 a month supports 220.42477...
+FACTOR_2_6_25 = 220.424777
+
+
+def test_annuity_factor():
+    assert annuity_factor(0.026, 25) == pytest.approx(FACTOR_2_6_25)
+    assert monthly_instalment(300_000, 0.026, 25) == pytest.approx(1361.01, abs=0.01)
+    # One month at 12% a year: 1 / 1.01
+    assert annuity_factor(0.12, 1 / 12) == pytest.approx(1 / 1.01)
+
+
+def test_annuity_factor_at_zero_interest_is_the_number_of_months():
+    assert annuity_factor(0.0, 25) == 300
+    np.testing.assert_allclose(annuity_factor([0.0, 0.026], [10, 25]), [120, FACTOR_2_6_25])
+    assert monthly_instalment(120_000, 0.0, 10) == 1000
+
+
+def test_repayment_cap():
+    # MSR binds: 30% of 8,000 is 2,400, under the TDSR room of 4,400 - 500
+    assert repayment_cap(8000, 500) == 2400
+    # TDSR binds once debts exceed 25% of income: 4,400 - 2,500 = 1,900
+    assert repayment_cap(8000, 2500) == 1900
+    # Debts above 55% of income leave no room for a loan at all
+    assert repayment_cap(8000, 4500) == 0
+    np.testing.assert_array_equal(repayment_cap([8000, 8000, 8000], [500, 2500, 4500]), [2400, 1900, 0])
+
+
+def test_max_loan():
+    assert max_loan(8000, 500, 0.026, 25) == pytest.approx(2400 * FACTOR_2_6_25)
+    assert max_loan(8000, 500, 0.026, 25) == pytest.approx(529_019.47, abs=0.01)
+    assert max_loan(8000, 2500, 0.026, 25) == pytest.approx(1900 * FACTOR_2_6_25)
+    assert max_loan(8000, 4500, 0.026, 25) == 0
+
+
+def test_loan_grid_shape_and_values():
+    incomes = [4000, 8000]
+    rates = [0.0, 0.026, 0.04]
+    tenures = [10, 20, 25, 30]
+    grid = loan_grid(incomes, 500, rates, tenures)
+    assert grid.shape == (2, 3, 4)
+    assert grid[1, 1, 2] == pytest.approx(max_loan(8000, 500, 0.026, 25))
+    assert grid[0, 0, 0] == 1200 * 120
+    # Lower rates and longer tenures always allow a larger loan
+    assert (np.diff(grid, axis=1) < 0).all()
+    assert (np.diff(grid, axis=2) > 0).all()
+
+
+def test_sensitivity_grid():
+    grid = sensitivity_grid(8000, 500, 100_000, [0.026, 0.03], [20, 25])
+    assert list(grid.index) == [0.026, 0.03] and list(grid.columns) == [20, 25]
+    assert grid.loc[0.026, 25] == pytest.approx(629_019.47, abs=0.01)
@@ -0,0 +1,108 @@
+import glob
+import os
+import shutil
+
+import pytest
+import query_cache
+from data_store import DATA_DIR, ingest, source_signature
+from query_cache import (SUMMARY_AGGREGATES, SUMMARY_COLUMNS, QueryResultCache, normalize_query, result_cache,
+                         run_queries)
+from query_executor import QueryExecutor, QueryRejected
+
+PRECOMPUTED = (
+    [f"df['{column}'].value_counts()" for column in SUMMARY_COLUMNS] +
+    [f"df.groupby('{column}')['resale_price'].{aggregate}()"
+     for column in SUMMARY_COLUMNS for aggregate in SUMMARY_AGGREGATES] +
+    [f"df[df['month'].dt.year == {year}]" for year in (2012, 2015, 2016, 2020)]
+)
+
+
+@pytest.fixture(scope='module')
+def bundled(tmp_path_factory):
+    # The bundled releases, ingested into a scratch directory
+    data_dir = tmp_path_factory.mktemp("data")
+    for file in glob.glob(os.path.join(DATA_DIR, "*.csv")):
+        shutil.copy2(file, data_dir)
+    df, _ = ingest(source_signature(data_dir), data_dir)
+    return df
+
+
+@pytest.fixture(scope='module')
+def executor(bundled):
+    executor = QueryExecutor(bundled, workers=1)
+    yield executor
+    executor.close()
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    result_cache.clear()
+    yield
+    result_cache.clear()
+
+
+def test_precomputed_results_format_like_the_executor(bundled, executor, monkeypatch):
+    def no_executor(df):
+        raise AssertionError("a precomputed query reached the executor")
+
+    monkeypatch.setattr(query_cache, 'query_executor', no_executor)
+    outcomes = run_queries(bundled, PRECOMPUTED)
+    expected = executor.run_many(PRECOMPUTED)
+    for query, outcome, run in zip(PRECOMPUTED, outcomes, expected):
+        assert run[0], run[1]
+        assert outcome == run, query
+
+
+def test_other_queries_go_to_the_executor(bundled, executor):
+    queries = ["df['resale_price'].mean()", "df[df['month'].dt.year >= 2015]['resale_price'].max()",
+               "df.groupby('town')['floor_area_sqm'].mean()"]
+    assert run_queries(bundled, queries) == executor.run_many(queries)
+    assert result_cache.stats()['entries'] == len(queries)
+
+
+@pytest.mark.parametrize('variant', [
+    "df [ \"town\" ].value_counts( )",
+    "(df['town']).value_counts()",
+    "df['town'] .value_counts()",
+])
+def test_key_ignores_spacing_quotes_and_parentheses(variant):
+    assert normalize_query(variant) == normalize_query("df['town'].value_counts()")
+
+
+def test_key_tells_different_queries_apart():
+    assert normalize_query("df['town'].value_counts()") != normalize_query("df['flat_type'].value_counts()")
+    assert (normalize_query("df[df['month'].dt.year == 2015]") !=
+            normalize_query("df[df['month'].dt.year == 2016]"))
+    with pytest.raises(QueryRejected):
+        normalize_query("__import__('os')")
+
+
+def test_equivalent_queries_share_a_cached_result(bundled):
+    first = run_queries(bundled, ["df['resale_price'].median()"])
+    assert run_queries(bundled, ["df[ \"resale_price\" ].median( )"]) == first
+    assert result_cache.stats()['hits'] == 1
+
+
+def test_eviction_is_bounded_by_characters():
+    cache = QueryResultCache(max_entries=10, max_chars=10)
+    cache.set('a', "aaaa")
+    cache.set('b', "bbbb")
+    assert cache.get('a') == "aaaa"
+    # 12 characters: the least recently used entry goes
+    cache.set('c', "cccc")
+    assert cache.get('b') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 2, 'chars': 8}
+
+    # Replacing an entry counts its new size only
+    cache.set('a', "aa")
+    assert cache.stats()['chars'] == 6
+    # A result larger than the whole cache is not kept
+    cache.set('d', "d" * 11)
+    assert cache.stats()['entries'] == 0 and cache.stats()['chars'] == 0
+
+
+def test_eviction_is_bounded_by_entries():
+    cache = QueryResultCache(max_entries=2, max_chars=1000)
+    for key in "abc":
+        cache.set(key, key)
+    assert [cache.get(key) for key in "abc"] == [None, "b", "c"]
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from query_engine import QueryEngine
+
+ROWS = 5000
+
+FILTERS = [
+    dict(flat_type='4 room', year=2015, town='bedok'),
+    dict(flat_type='4 room', year=2015, town='bedok', area_range=(90, 110)),
+    dict(town=['bedok', 'tampines'], year=[2014, 2015, 2018], exact=True),
+    dict(flat_type='room', year=[2013, 2014]),
+    dict(flat_model='model a', month_range=('2016-03', '2016-09')),
+    dict(area_range=(60, 70)),
+    dict(town='bedok', area_range=(100, 120)),
+    dict(year=2016),
+    dict(town='yishun', year=2015),
+]
+
+
+def _frame(sorted_months):
+    rng = np.random.default_rng(0)
+    months = pd.to_datetime('2012-01-01') + pd.to_timedelta(rng.integers(0, 365 * 8, ROWS), unit='D')
+    df = pd.DataFrame({
+        'month': months.to_period('M').to_timestamp(),
+        'town': pd.Categorical(rng.choice(['bedok', 'tampines', 'woodlands'], ROWS),
+                               categories=['bedok', 'tampines', 'woodlands', 'yishun']),
+        'flat_type': pd.Categorical(rng.choice(['3 room', '4 room', 'executive'], ROWS)),
+        'flat_model': pd.Categorical(rng.choice(['improved', 'model a', 'new generation'], ROWS)),
+        'floor_area_sqm': rng.integers(40, 150, ROWS).astype(float),
+    })
+    return df.sort_values('month', ignore_index=True) if sorted_months else df
+
+
+def _expected(df, flat_type=None, year=None, town=None, flat_model=None,
+              area_range=None, month_range=None, exact=False):
+    # The same filters as plain boolean masks over every row
+    mask = np.ones(len(df), dtype=bool)
+    for column, value in (('flat_type', flat_type), ('town', town), ('flat_model', flat_model)):
+        if value:
+            values = [value] if isinstance(value, str) else value
+            text = df[column].astype(str)
+            mask &= text.isin(values) if exact else text.apply(lambda v: any(x in v for x in values))
+    if year:
+        mask &= df['month'].dt.year.isin([year] if isinstance(year, int) else year)
+    if month_range:
+        mask &= (df['month'] >= month_range[0]) & (df['month'] < month_range[1])
+    if area_range:
+        mask &= df['floor_area_sqm'].between(*area_range)
+    return np.flatnonzero(mask.to_numpy())
+
+
+@pytest.mark.parametrize('sorted_months', [True, False])
+@pytest.mark.parametrize('filters', FILTERS)
+def test_rows_match_a_full_scan(sorted_months, filters):
+    df = _frame(sorted_months)
+    rows = QueryEngine(df).rows(**filters)
+    np.testing.assert_array_equal(rows, _expected(df, **filters))
+
+
+def test_no_filters_means_every_row():
+    assert QueryEngine(_frame(True)).rows() is None
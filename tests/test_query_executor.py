@@ -0,0 +1,70 @@
+import os
+
+import pandas as pd
+import pytest
+from query_executor import QueryExecutor, QueryRejected, validate_query
+
+# Payloads that reached methods outside the whitelist through agg, aggregate
+# or pivot_table looking a string name up with getattr
+BYPASSES = [
+    "df['resale_price'].agg('to_csv', path_or_buf='{path}')",
+    "df.head().agg('to_pickle', path='{path}')",
+    "df.agg('eval', expr='resale_price * 2')",
+    "df.groupby('town')['resale_price'].agg('apply', len)",
+    "df.agg('to_string')",
+    "df.aggregate('to_csv', '{path}')",
+    "df.agg(func='to_csv', path_or_buf='{path}')",
+    "df.agg(['mean', 'to_csv'])",
+    "df.groupby('town').agg({{'resale_price': 'to_csv'}})",
+    "df.groupby('town').agg(total=('resale_price', 'to_csv'))",
+    "df.groupby('town').agg('to_' + 'csv')",
+    "df['resale_price'].agg(df['town'].iloc[0])",
+    "df['resale_price'].rolling(3).agg('apply', len)",
+    "df.set_index('month')['resale_price'].resample('M').agg('to_csv', '{path}')",
+    "df.pivot_table(values='resale_price', index='town', aggfunc='to_csv')",
+    "df.pivot_table('resale_price', 'town', None, 'eval')",
+]
+
+ALLOWED = [
+    "df['resale_price'].agg('mean')",
+    "df.groupby('town')['resale_price'].agg(['mean', 'median', 'count'])",
+    "df.groupby('town').agg({'resale_price': 'max', 'floor_area_sqm': ['min', 'max']})",
+    "df.groupby('town').agg(average=('resale_price', 'mean'))",
+    "df.groupby('town')['resale_price'].aggregate(len)",
+    "df.pivot_table(values='resale_price', index='town', columns='flat_type', aggfunc='median')",
+    "df[df['month'].dt.year == 2015]['resale_price'].mean()",
+]
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return pd.DataFrame({
+        'month': pd.to_datetime(['2015-01', '2015-02', '2015-03', '2015-04']),
+        'town': pd.Categorical(['bedok', 'bedok', 'yishun', 'yishun']),
+        'flat_type': pd.Categorical(['4 room', '3 room', '4 room', '3 room']),
+        'floor_area_sqm': [90.0, 70.0, 95.0, 68.0],
+        'resale_price': [400000, 300000, 380000, 290000],
+    })
+
+
+@pytest.mark.parametrize('query', BYPASSES)
+def test_aggregations_by_name_are_limited_to_reductions(query, tmp_path):
+    with pytest.raises(QueryRejected):
+        validate_query(query.format(path=tmp_path / 'pwned'))
+
+
+@pytest.mark.parametrize('query', ALLOWED)
+def test_safe_aggregations_are_allowed(query, frame):
+    validate_query(query)
+    eval(compile(validate_query(query), '<query>', 'eval'), {'df': frame})
+
+
+def test_executor_refuses_bypasses_without_side_effects(frame, tmp_path):
+    executor = QueryExecutor(frame, workers=1)
+    try:
+        outcomes = executor.run_many([query.format(path=tmp_path / 'pwned') for query in BYPASSES])
+        assert all(not ok and text.startswith("query not allowed") for ok, text in outcomes)
+        assert os.listdir(tmp_path) == []
+        assert executor.run("df['resale_price'].agg('max')") == (True, "400000")
+    finally:
+        executor.close()
@@ -0,0 +1,38 @@
+import glob
+import os
+import threading
+
+import pandas as pd
+import pytest
+import trend_charts
+from data_store import DATA_DIR, ingest, source_signature
+from trend_charts import prerender_charts_in_background, trend_chart
+
+
+@pytest.fixture
+def frame(tmp_path):
+    # A slice of the newest bundled release, ingested like the real data
+    newest = sorted(glob.glob(os.path.join(DATA_DIR, "*.csv")))[-1]
+    pd.read_csv(newest, nrows=500).to_csv(tmp_path / "release.csv", index=False)
+    df, _ = ingest(source_signature(tmp_path), tmp_path)
+    return df
+
+
+def test_charts_are_prerendered_off_the_script_thread(frame, monkeypatch):
+    rendered = []
+    render_svg = trend_charts._render_svg
+
+    def recording_render(monthly, rolling_months):
+        rendered.append(threading.current_thread().name)
+        return render_svg(monthly, rolling_months)
+
+    monkeypatch.setattr(trend_charts, '_render_svg', recording_render)
+    thread = prerender_charts_in_background(frame)
+    assert prerender_charts_in_background(frame) is thread
+    thread.join()
+    flat_types = list(frame['flat_type'].cat.categories)
+    assert rendered == ["chart-prerender"] * (1 + len(flat_types))
+
+    # Served from the cache afterwards
+    assert trend_chart(frame, flat_type=flat_types[0]).startswith("<?xml")
+    assert len(rendered) == 1 + len(flat_types)
@@ -0,0 +1,133 @@
+import io
+import threading
+
+import pandas as pd
+import streamlit as st
+from data_store import derived
+from matplotlib.figure import Figure
+from price_cube import monthly_mean, price_cube, select_cells
+from query_cache import data_version
+
+# Months in the rolling median drawn over each monthly average series
+ROLLING_MONTHS = 6
+# Bounds of the per-process caches of series and rendered charts
+MAX_SERIES = 256
+MAX_CHARTS = 128
+
+FIGURE_SIZE = (8, 4.5)
+
+
+def _as_tuple(value):
+    # Filters are cache keys, so lists become sorted tuples ("bedok and
+    # tampines" and "tampines and bedok" share an entry)
+    if value is None:
+        return ()
+    if isinstance(value, (str, int)):
+        return (value,)
+    return tuple(sorted(value))
+
+
+def trend_key(flat_type=None, year=None, town=None):
+    """Normalized filters of a trend chart, usable as a cache key."""
+    return _as_tuple(flat_type), _as_tuple(year), _as_tuple(town)
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_SERIES)
+def _cached_series(version, key, _df):
+    flat_types, years, towns = key
+    cube = price_cube(_df)
+
+    # One series per town when several are asked for, else one per flat type,
+    # else a single series over everything matching
+    if len(towns) > 1:
+        groups = {town: dict(town=town, flat_type=flat_types) for town in towns}
+    elif len(flat_types) > 1:
+        groups = {flat_type: dict(town=towns, flat_type=flat_type) for flat_type in flat_types}
+    else:
+        groups = {"All matching flats": dict(town=towns, flat_type=flat_types)}
+
+    series = {}
+    for label, filters in groups.items():
+        cells = select_cells(cube, year=list(years), exact=True, **filters)
+        series[label] = monthly_mean(cells)
+    return pd.DataFrame(series)
+
+
+def trend_series(df, flat_type=None, year=None, town=None):
+    """Monthly average resale price per series, cached per data version and filters.
+
+    Text filters are exact lowercase values or lists of them, as in
+    select_cells(exact=True). Several towns (or else several flat types)
+    give one column each.
+    """
+    return _cached_series(data_version(df), trend_key(flat_type, year, town), df)
+
+
+def _render_svg(monthly, rolling_months):
+    # A Figure not attached to pyplot is never registered with the pyplot
+    # figure manager, so it needs no plt.close and is safe to draw from
+    # several script threads at once
+    fig = Figure(figsize=FIGURE_SIZE)
+    ax = fig.subplots()
+    for label, values in monthly.items():
+        values = values.dropna()
+        if values.empty:
+            continue
+        line, = ax.plot(values.index, values.values, linewidth=0.8, alpha=0.35)
+        smoothed = values.rolling(rolling_months, min_periods=1).median()
+        ax.plot(smoothed.index, smoothed.values, color=line.get_color(), linewidth=2,
+                label=f"{label} ({rolling_months}-month rolling median)")
+    ax.set_title("Average Resale Price Trend Over Time")
+    ax.set_xlabel("Month")
+    ax.set_ylabel("Average Resale Price (SGD)")
+    ax.yaxis.set_major_formatter(lambda value, _: f"{value:,.0f}")
+    if ax.get_legend_handles_labels()[0]:
+        ax.legend(fontsize='small')
+    fig.tight_layout()
+
+    buffer = io.StringIO()
+    fig.savefig(buffer, format='svg')
+    return buffer.getvalue()
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_CHARTS)
+def _cached_chart(version, key, rolling_months, _df):
+    monthly = _cached_series(version, key, _df)
+    if monthly.dropna(how='all').empty:
+        return None
+    return _render_svg(monthly, rolling_months)
+
+
+def trend_chart(df, flat_type=None, year=None, town=None, rolling_months=ROLLING_MONTHS):
+    """The trend chart for the filters as an SVG string, or None when nothing matches.
+
+    Charts are rendered once per data version, filters and window and then
+    served from the cache, so a repeat request does no matplotlib work.
+    """
+    return _cached_chart(data_version(df), trend_key(flat_type, year, town), rolling_months, df)
+
+
+def prerender_charts(df, flat_types=None):
+    """Renders the charts most likely to be asked for ahead of the first request.
+
+    That is the overall trend and the trend of each flat type.
+    """
+    trend_chart(df)
+    for flat_type in flat_types if flat_types is not None else price_cube(df)['flat_type'].cat.categories:
+        trend_chart(df, flat_type=flat_type)
+
+
+def _start_prerender(df):
+    thread = threading.Thread(target=prerender_charts, args=(df,), name="chart-prerender", daemon=True)
+    thread.start()
+    return thread
+
+
+def prerender_charts_in_background(df):
+    """Starts prerender_charts on a background thread, once per frame.
+
+    Rendering takes a second or more, so it is kept off the script thread
+    and the page does not wait for it; a chart asked for before it is
+    ready is rendered on demand as usual. Returns the thread.
+    """
+    return derived(df, 'chart_prerender', _start_prerender)
@@ -1,14 +1,45 @@
+import hashlib
+import hmac
+import os
+import threading
 import streamlit as st
 import bcrypt
 
-# Precomputed hashed password stored in secrets
+class PasswordVerifier:
+    """Checks passwords against the bcrypt hash of the app password.
 
-# Fetch the hashed password from Streamlit secrets and encode it to bytes
-hashed_password = st.secrets["STREAMLIT_PASSWORD"].encode('utf-8')  # Ensure it is in bytes
+    bcrypt is slow on purpose, so once a password has passed the check, a
+    keyed hash of it is remembered for the life of the process and later
+    logins with it skip bcrypt. Wrong passwords always pay the full check.
+    """
+
+    def __init__(self, hashed_password):
+        self.hashed_password = hashed_password
+        self._key = os.urandom(32)
+        self._verified = set()
+        self._lock = threading.Lock()
+
+    def check(self, password):
+        password = password.encode('utf-8')
+        digest = hmac.new(self._key, password, hashlib.sha256).digest()
+        with self._lock:
+            if any(hmac.compare_digest(digest, known) for known in self._verified):
+                return True
+        if not bcrypt.checkpw(password, self.hashed_password):
+            return False
+        with self._lock:
+            self._verified.add(digest)
+        return True
+
+# Precomputed hashed password stored in secrets, read on the first login
+# attempt rather than at import, and once per process
+@st.cache_resource
+def password_verifier():
+    return PasswordVerifier(st.secrets["STREAMLIT_PASSWORD"].encode('utf-8'))  # Ensure it is in bytes
 
 def authenticate(password):
     # Check if the provided password matches the hashed password
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+    return password_verifier().check(password)
 
 def password_protect():
     if 'authenticated' not in st.session_state: